@@ -20,13 +20,6 @@ def check_ssl_no_verify():
 ssl_no_verify = check_ssl_no_verify()
 
 
-def request_kwargs( token=None ):
-    return {
-        **({'headers': {'Authorization': f'Bearer {token}'}} if token is not None else {}),
-        **({'verify': False} if ssl_no_verify else {}),
-    }
-
-
 def explain_first_request_exception( e ):
     if e.__class__ == requests.exceptions.SSLError:
         print_err( 'SSL error. If you trust the server and accept your vulnerability to man-in-the-middle (MitM) attacks, you may try:\n'
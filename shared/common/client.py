@@ -0,0 +1,107 @@
+import time
+
+import requests
+import requests.adapters
+
+from shared.common.auth import ssl_no_verify
+from shared.common.retry import DEFAULT_MAX_ATTEMPTS
+from shared.common.retry import RetryPolicy
+from shared.common.retry import is_duplicate_create
+from shared.common.retry import is_idempotent
+from shared.common.throttle import OVERLOAD_STATUS_CODES
+from shared.common.throttle import AdaptiveLimiter
+from shared.common.utils import print_err
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = 300.0
+DEFAULT_CONNECT_TIMEOUT = 10.0
+
+
+class Client:
+    def __init__( self, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT ):
+        self.session = None
+        self.configure( pool_size, timeout )
+
+    def configure( self, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT, adaptive=False,
+                   max_attempts=DEFAULT_MAX_ATTEMPTS, max_in_flight=None ):
+        # `max_in_flight` bounds the adaptive limit, default: `pool_size`
+        if self.session is not None:
+            self.session.close()
+        self.pool_size = pool_size
+        self.limiter = AdaptiveLimiter( max_in_flight or pool_size ) if adaptive else None
+        self.retry_policy = RetryPolicy( max_attempts )
+        self.timeout = (min( DEFAULT_CONNECT_TIMEOUT, timeout ), timeout)
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter( pool_connections=pool_size, pool_maxsize=pool_size )
+        self.session.mount( 'http://', adapter )
+        self.session.mount( 'https://', adapter )
+        if ssl_no_verify:
+            self.session.verify = False
+
+    def request( self, method, url, token=None, retry=None, **kwargs ):
+        # `retry` defaults to whether the request is idempotent (see shared.common.retry.is_idempotent)
+        if token is not None:
+            kwargs['headers'] = {**kwargs.get( 'headers', {} ), 'Authorization': f'Bearer {token}'}
+        kwargs.setdefault( 'timeout', self.timeout )
+        if retry is None:
+            retry = is_idempotent( method, kwargs.get( 'json' ) )
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                r = self._send( method, url, **kwargs )
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if not self.retry_policy.should_retry( attempt, None, retry ):
+                    raise
+                self._wait_for_retry( method, url, attempt, e.__class__.__name__ )
+                continue
+            if attempt > 1 and is_duplicate_create( method, kwargs.get( 'json' ), r ):
+                if isinstance( kwargs['json'], list ):
+                    # some entities of the batch may be missing, the caller has to check them one by one
+                    return r
+                # an earlier attempt created the entity, only its response got lost
+                return self.request( 'GET', f'{url.rstrip( "/" )}/{kwargs["json"]["id"]}',
+                                     **{key: value for key, value in kwargs.items() if key != 'json'} )
+            retry_after = r.headers.get( 'Retry-After' )
+            if 200 <= r.status_code < 300 or not self.retry_policy.should_retry( attempt, r.status_code, retry,
+                                                                                 retry_after ):
+                return r
+            self._wait_for_retry( method, url, attempt, str( r.status_code ), r.status_code, retry_after )
+
+    def _wait_for_retry( self, method, url, attempt, reason, status_code=None, retry_after=None ):
+        print_err( f'\nNote: {method} {url} failed with {reason}, '
+                   f'retrying ({attempt + 1}/{self.retry_policy.max_attempts})...' )
+        if self.limiter is not None and retry_after is not None and status_code in OVERLOAD_STATUS_CODES:
+            # the limiter already pauses all requests until the server is ready again
+            return
+        time.sleep( self.retry_policy.delay( attempt, retry_after ) )
+
+    def _send( self, method, url, **kwargs ):
+        if self.limiter is None:
+            return self.session.request( method, url, **kwargs )
+        self.limiter.acquire()
+        start = time.monotonic()
+        r = None
+        try:
+            r = self.session.request( method, url, **kwargs )
+            return r
+        finally:
+            self.limiter.release( time.monotonic() - start,
+                                  r.status_code if r is not None else None,
+                                  r.headers.get( 'Retry-After' ) if r is not None else None )
+
+    def get( self, url, token=None, **kwargs ):
+        return self.request( 'GET', url, token, **kwargs )
+
+    def post( self, url, token=None, **kwargs ):
+        return self.request( 'POST', url, token, **kwargs )
+
+    def put( self, url, token=None, **kwargs ):
+        return self.request( 'PUT', url, token, **kwargs )
+
+    def delete( self, url, token=None, **kwargs ):
+        return self.request( 'DELETE', url, token, **kwargs )
+
+
+# shared by all scripts so that connections are kept alive between requests
+client = Client()
@@ -0,0 +1,67 @@
+import gc
+import json
+
+# orjson parses several times faster than the stdlib, install it with `poetry install -E fast` (or `pip install orjson`)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = 'orjson' if orjson is not None else 'json'
+
+# the cyclic garbage collector would run over and over while decoding a large document, which cannot contain cycles
+LARGE_DOCUMENT_SIZE = 1 << 20
+
+# the decode errors of all backends (json.JSONDecodeError, orjson.JSONDecodeError) derive from ValueError
+DecodeError = ValueError
+
+# the stdlib writes our files, the fast backends differ in whitespace, escaping (ensure_ascii) and float formatting
+_compact_encoder = json.JSONEncoder( separators=(',', ':') )
+
+
+def loads( data ):
+    # `data` may be str or bytes
+    if len( data ) < LARGE_DOCUMENT_SIZE or not gc.isenabled():
+        return _loads( data )
+    gc.disable()
+    try:
+        return _loads( data )
+    finally:
+        gc.enable()
+
+
+def _loads( data ):
+    if orjson is not None:
+        try:
+            return orjson.loads( data )
+        except orjson.JSONDecodeError:
+            # what orjson rejects but the stdlib accepts (e.g. integers beyond 64 bit, NaN), or the stdlib error message
+            pass
+    return json.loads( data )
+
+
+def dumps( value ):
+    return json.dumps( value )
+
+
+def dumps_compact( value ):
+    return _compact_encoder.encode( value )
+
+
+def dumps_pretty( value ):
+    return json.dumps( value, indent=4, sort_keys=False )
+
+
+def encoder( indent=None ):
+    # for writing a document piece by piece, byte-compatible with `json.dump( ..., indent=indent )`
+    return json.JSONEncoder( indent=indent, separators=(',', ': ') if indent is not None else (',', ':') )
+
+
+def raw_decoder():
+    # for decoding values at an offset of a larger document (`raw_decode`), which the fast backends cannot do
+    return json.JSONDecoder()
+
+
+def response_json( r ):
+    # replaces `r.json()`, which decodes with simplejson or json depending on what happens to be installed
+    return loads( r.content )
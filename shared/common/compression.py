@@ -0,0 +1,66 @@
+import bz2
+import gzip
+import io
+import lzma
+import os
+
+COMPRESSIONS = {
+    # name: extension, magic bytes, wraps a binary file object
+    'gzip': ('.gz', b'\x1f\x8b', lambda f, mode: gzip.GzipFile( fileobj=f, mode=mode, compresslevel=6 )),
+    'bz2': ('.bz2', b'BZh', lambda f, mode: bz2.BZ2File( f, mode )),
+    'xz': ('.xz', b'\xfd7zXZ\x00', lambda f, mode: lzma.LZMAFile( f, mode )),
+}
+
+
+def compression_of( filename ):
+    # by extension, e.g. `export.json.gz`
+    for name, (extension, _, _) in COMPRESSIONS.items():
+        if filename.endswith( extension ):
+            return name
+    return None
+
+
+def detect_compression( raw ):
+    # by magic bytes, without consuming them
+    head = raw.peek( 6 )
+    for name, (_, magic, _) in COMPRESSIONS.items():
+        if head.startswith( magic ):
+            return name
+    return None
+
+
+class CompressedFile:
+    # Text file (utf-8 by default) which gets decompressed on reading and compressed on writing transparently.
+    # Reading detects the compression by magic bytes, writing uses `compression` (see compression_of).
+
+    def __init__( self, filename, mode='r', compression=None, encoding='utf-8' ):
+        assert mode in ('r', 'w')
+        self.raw = open( filename, mode + 'b' )
+        if mode == 'r':
+            compression = detect_compression( self.raw )
+        self.stream = self.raw if compression is None else COMPRESSIONS[compression][2]( self.raw, mode + 'b' )
+        self.compression = compression
+        # no newline translation, so that offsets match the file
+        self.text = io.TextIOWrapper( self.stream, encoding=encoding, newline='' )
+
+    def read( self, size=-1 ):
+        return self.text.read( size )
+
+    def readline( self, size=-1 ):
+        return self.text.readline( size )
+
+    def __iter__( self ):
+        return iter( self.text )
+
+    def write( self, string ):
+        return self.text.write( string )
+
+    def close( self, sync=False ):
+        # compressed streams only write their trailer on close, so `sync` has to wait until then
+        stream = self.text.detach()
+        if stream is not self.raw:
+            stream.close()
+        if sync:
+            self.raw.flush()
+            os.fsync( self.raw.fileno() )
+        self.raw.close()
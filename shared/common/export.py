@@ -0,0 +1,279 @@
+import os
+import re
+
+from shared.common.codec import DecodeError
+from shared.common.codec import encoder
+from shared.common.codec import loads
+from shared.common.codec import raw_decoder
+from shared.common.compression import CompressedFile
+from shared.common.compression import compression_of
+from shared.common.ndjson_export import NdjsonExportReader
+from shared.common.ndjson_export import NdjsonExportWriter
+from shared.common.ndjson_export import is_ndjson_file
+from shared.common.ndjson_export import is_ndjson_filename
+from shared.common.sqlite_export import SqliteExportReader
+from shared.common.sqlite_export import SqliteExportWriter
+from shared.common.sqlite_export import is_sqlite_file
+from shared.common.sqlite_export import is_sqlite_filename
+
+DEFAULT_INDENT = 4
+
+
+class ExportWriter:
+    # Writes `{**header, "data": {collection: [entity, ...], ...}}` one entity at a time.
+    # The result equals `json.dump( ..., indent=indent )` of the complete document (`indent=None` writes it compact).
+    # Everything goes to a temporary file which replaces `filename` on commit, so it never contains partial data.
+    # The extension of `filename` selects the compression (`.gz`, `.bz2` or `.xz`).
+
+    def __init__( self, filename, header, indent=DEFAULT_INDENT ):
+        self.filename = filename
+        self.temp_filename = f'{filename}.tmp'
+        self.indent = indent
+        self.encoder = encoder( indent )
+        self.file = CompressedFile( self.temp_filename, 'w', compression_of( filename ) )
+        self.collections = 0
+        self.file.write( '{' )
+        for key, value in header.items():
+            self._write_key( 1, key )
+            self.file.write( self._encode( 1, value ) )
+            self.file.write( ',' )
+        self._write_key( 1, 'data' )
+        self.file.write( '{' )
+
+    def write_collection( self, key, entities ):
+        # `entities` may be a generator
+        if self.collections > 0:
+            self.file.write( ',' )
+        self._write_key( 2, key )
+        self.collections += 1
+        self.file.write( '[' )
+        count = 0
+        for entity in entities:
+            if count > 0:
+                self.file.write( ',' )
+            self.file.write( self._newline( 3 ) )
+            self.file.write( self._encode( 3, entity ) )
+            count += 1
+        if count > 0:
+            self.file.write( self._newline( 2 ) )
+        self.file.write( ']' )
+
+    def commit( self ):
+        if self.collections > 0:
+            self.file.write( self._newline( 1 ) )
+        self.file.write( '}' )
+        self.file.write( self._newline( 0 ) )
+        self.file.write( '}' )
+        self.file.close( sync=True )
+        os.replace( self.temp_filename, self.filename )
+
+    def abort( self ):
+        self.file.close()
+        os.remove( self.temp_filename )
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, exc_type, exc_value, traceback ):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+    def _newline( self, depth ):
+        if self.indent is None:
+            return ''
+        return '\n' + ' ' * (self.indent * depth)
+
+    def _write_key( self, depth, key ):
+        self.file.write( self._newline( depth ) )
+        self.file.write( self._encode( depth, key ) )
+        self.file.write( self.encoder.key_separator )
+
+    def _encode( self, depth, value ):
+        # json never contains raw newlines within strings, so this only indents the nested lines
+        return self.encoder.encode( value ).replace( '\n', self._newline( depth ) )
+
+
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+WHITESPACE = re.compile( r'[ \t\n\r]*' )
+SEPARATOR = re.compile( r'[ \t\n\r]*,[ \t\n\r]*' )
+DELIMITERS = ' \t\n\r,:]}'
+
+
+class ExportReader:
+    # Incremental parser for `{..., "data": {collection: [entity, ...], ...}, ...}` which only keeps the entity
+    # being parsed (and a chunk of the file) in memory.
+    # All other top-level fields end up in `header` as soon as the parser passed them.
+    # Compressed files (gzip, bz2 or xz) get decompressed on the fly.
+    # With `encoding='latin-1'` every byte is one character, so offsets are byte offsets (see shared.common.export_index).
+
+    def __init__( self, filename, chunk_size=DEFAULT_CHUNK_SIZE, encoding='utf-8' ):
+        self.filename = filename
+        self.file = CompressedFile( filename, encoding=encoding )
+        self.chunk_size = chunk_size
+        self.decoder = raw_decoder()
+        self.buffer = ''
+        self.pos = 0
+        self.offset = 0
+        self.eof = False
+        self.header = {}
+        self.data_index = None
+
+    def collections( self, with_offsets=False ):
+        # Yields `(key, entities)` for every collection. `entities` is a generator, whatever the caller does not
+        # consume of it gets skipped when asking for the next collection.
+        # With `with_offsets`, entities are `(start, end, entity)` with the offsets of the entity in the file.
+        self._expect( '{' )
+        first = True
+        while self._next_member( '}', first ):
+            first = False
+            key = self._key()
+            if key != 'data' or self.data_index is not None:
+                self.header[key] = self._value()
+                continue
+            self.data_index = len( self.header )
+            self._expect( '{' )
+            first_collection = True
+            while self._next_member( '}', first_collection ):
+                first_collection = False
+                collection = self._key()
+                entities = self._entities( with_offsets )
+                yield collection, entities
+                for _ in entities:
+                    pass
+        if self._peek() != '':
+            self._error( 'end of file' )
+
+    def load( self ):
+        # same as `json.load`
+        if self.pos == 0 and self.buffer == '':
+            # parsing the whole file at once is faster than parsing it incrementally
+            try:
+                data = loads( self.file.read() )
+            except DecodeError as e:
+                raise ValueError( f'{self.filename}: {e}' )
+            self.eof = True
+            if not isinstance( data, dict ):
+                raise ValueError( f'{self.filename}: expected an object' )
+            return data
+        data = {key: list( entities ) for key, entities in self.collections()}
+        if self.data_index is None:
+            return dict( self.header )
+        items = list( self.header.items() )
+        return dict( items[:self.data_index] + [('data', data)] + items[self.data_index:] )
+
+    def close( self ):
+        self.file.close()
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, exc_type, exc_value, traceback ):
+        self.close()
+
+    def _entities( self, with_offsets=False ):
+        self._expect( '[' )
+        first = True
+        while self._next_member( ']', first ):
+            first = False
+            self._peek()
+            start = self.offset + self.pos
+            value = self._value()
+            yield (start, self.offset + self.pos, value) if with_offsets else value
+            # fast path for the common case of the next entity being buffered completely
+            while True:
+                match = SEPARATOR.match( self.buffer, self.pos )
+                if match is None:
+                    break
+                try:
+                    value, end = self.decoder.raw_decode( self.buffer, match.end() )
+                except DecodeError:
+                    break
+                if end >= len( self.buffer ) or self.buffer[end] not in DELIMITERS:
+                    break
+                start = self.offset + match.end()
+                self.pos = end
+                yield (start, self.offset + end, value) if with_offsets else value
+
+    def _next_member( self, end, first ):
+        # skips the separator, returns False at the end of the object or array
+        c = self._peek()
+        if c == end:
+            self.pos += 1
+            return False
+        if not first:
+            if c != ',':
+                self._error( f'"," or "{end}"' )
+            self.pos += 1
+        return True
+
+    def _key( self ):
+        key = self._value()
+        if not isinstance( key, str ):
+            self._error( 'string' )
+        self._expect( ':' )
+        return key
+
+    def _value( self ):
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode( self.buffer, self.pos )
+            except DecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # a number may continue in the next chunk
+            if (end < len( self.buffer ) and self.buffer[end] in DELIMITERS) or not self._fill():
+                self.pos = end
+                return value
+
+    def _expect( self, char ):
+        if self._peek() != char:
+            self._error( f'"{char}"' )
+        self.pos += 1
+
+    def _peek( self ):
+        # skips whitespace and returns the next character ('' at the end of the file)
+        while True:
+            self.pos = WHITESPACE.match( self.buffer, self.pos ).end()
+            if self.pos < len( self.buffer ):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+
+    def _fill( self ):
+        # reads at least as much as already buffered, so that large values are not decoded over and over
+        if self.eof:
+            return False
+        chunk = self.file.read( max( self.chunk_size, len( self.buffer ) - self.pos ) )
+        if chunk == '':
+            self.eof = True
+            return False
+        self.offset += self.pos
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _error( self, expected ):
+        raise ValueError( f'{self.filename}: expected {expected} at offset {self.offset + self.pos}' )
+
+
+def open_export_writer( filename, header, indent=DEFAULT_INDENT ):
+    # `.sqlite`, `.sqlite3` and `.db` files become SQLite databases (see shared.common.sqlite_export),
+    # `.ndjson` and `.jsonl` files get one entity per line (see shared.common.ndjson_export)
+    if is_sqlite_filename( filename ):
+        return SqliteExportWriter( filename, header )
+    if is_ndjson_filename( filename ):
+        return NdjsonExportWriter( filename, header )
+    return ExportWriter( filename, header, indent )
+
+
+def open_export_reader( filename ):
+    if is_sqlite_file( filename ):
+        return SqliteExportReader( filename )
+    if is_ndjson_file( filename ):
+        return NdjsonExportReader( filename )
+    return ExportReader( filename )
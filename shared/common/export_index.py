@@ -0,0 +1,191 @@
+import itertools
+import os
+import sqlite3
+
+from shared.common.codec import dumps
+from shared.common.codec import loads
+from shared.common.compression import CompressedFile
+from shared.common.export import ExportReader
+from shared.common.ndjson_export import is_ndjson_file
+from shared.common.sqlite_export import is_sqlite_file
+
+SUFFIX = '.idx'
+
+# rows per query
+BATCH_SIZE = 500
+
+# Sidecar SQLite file `<export>.idx` with the byte range of every entity of an uncompressed json or ndjson export:
+#     meta( key, value )                                        signature (size and mtime of the export), layout, header
+#     collections( position, name )
+#     entities( collection, id, subject_id, offset, length )
+# Compressed exports cannot be indexed, as they do not allow seeking.
+
+
+def index_filename( filename ):
+    return filename + SUFFIX
+
+
+def _signature( filename ):
+    stat = os.stat( filename )
+    return f'{stat.st_size}:{stat.st_mtime_ns}'
+
+
+def _column( entity, field ):
+    value = entity.get( field ) if isinstance( entity, dict ) else None
+    return value if isinstance( value, (str, int, float) ) else None
+
+
+def _json_entities( filename, header ):
+    # yields (key, [(offset, length, entity), ...]) and fills `header`
+    # The file gets parsed as latin-1 to get byte offsets, so entities with non-ascii ids get parsed again as utf-8.
+    with ExportReader( filename, encoding='latin-1' ) as reader, open( filename, 'rb' ) as f:
+        def decoded( start, end, entity ):
+            if any( isinstance( value, str ) and not value.isascii()
+                    for value in (_column( entity, 'id' ), _column( entity, 'subject_id' )) ):
+                f.seek( start )
+                entity = loads( f.read( end - start ) )
+            return start, end - start, entity
+
+        for key, entities in reader.collections( with_offsets=True ):
+            yield key, (decoded( start, end, entity ) for start, end, entity in entities)
+        header.update( reader.header )
+
+
+def _ndjson_entities( filename, header ):
+    with open( filename, 'rb' ) as f:
+        line = f.readline()
+        header.update( loads( line ) )
+        offset = len( line )
+        key = None
+        records = []
+        for line in f:
+            if line.strip() != b'':
+                record = loads( line )
+                if record[0] != key:
+                    if key is not None:
+                        yield key, records
+                    key = record[0]
+                    records = []
+                if len( record ) == 2:
+                    records.append( (offset, len( line ), record[1]) )
+            offset += len( line )
+            if len( records ) >= BATCH_SIZE:
+                yield key, records
+                records = []
+        if key is not None:
+            yield key, records
+
+
+def build_index( filename ):
+    # one streaming pass over the export, returns the number of indexed entities
+    file = CompressedFile( filename )
+    file.close()
+    if file.compression is not None:
+        raise ValueError( f'{filename} is compressed and cannot be indexed' )
+    if is_sqlite_file( filename ):
+        raise ValueError( f'{filename} is a SQLite database and has its own indexes' )
+    layout = 'ndjson' if is_ndjson_file( filename ) else 'json'
+    signature = _signature( filename )
+
+    temp_filename = index_filename( filename ) + '.tmp'
+    if os.path.exists( temp_filename ):
+        os.remove( temp_filename )
+    connection = sqlite3.connect( temp_filename )
+    try:
+        connection.execute( 'PRAGMA journal_mode = OFF' )
+        connection.execute( 'PRAGMA synchronous = OFF' )
+        connection.execute( 'CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)' )
+        connection.execute( 'CREATE TABLE collections (position INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL)' )
+        connection.execute( 'CREATE TABLE entities (collection TEXT NOT NULL, id, subject_id, offset INTEGER NOT NULL, '
+                            'length INTEGER NOT NULL)' )
+        count = 0
+        header = {}
+        source = _ndjson_entities if layout == 'ndjson' else _json_entities
+        for key, entities in source( filename, header ):
+            connection.execute( 'INSERT OR IGNORE INTO collections (name) VALUES (?)', (key,) )
+            rows = [(key, _column( entity, 'id' ), _column( entity, 'subject_id' ), offset, length)
+                    for offset, length, entity in entities]
+            connection.executemany( 'INSERT INTO entities VALUES (?, ?, ?, ?, ?)', rows )
+            count += len( rows )
+        connection.execute( 'CREATE INDEX entities_id ON entities (collection, id)' )
+        connection.execute( 'CREATE INDEX entities_subject_id ON entities (collection, subject_id)' )
+        connection.executemany( 'INSERT INTO meta VALUES (?, ?)', [
+            ('signature', signature),
+            ('layout', layout),
+            ('header', dumps( header )),
+        ] )
+        connection.commit()
+    finally:
+        connection.close()
+    if _signature( filename ) != signature:
+        os.remove( temp_filename )
+        raise ValueError( f'{filename} changed while indexing it' )
+    os.replace( temp_filename, index_filename( filename ) )
+    return count
+
+
+def is_index_current( filename ):
+    if not os.path.exists( index_filename( filename ) ):
+        return False
+    connection = sqlite3.connect( index_filename( filename ) )
+    try:
+        row = connection.execute( "SELECT value FROM meta WHERE key = 'signature'" ).fetchone()
+    except sqlite3.DatabaseError:
+        return False
+    finally:
+        connection.close()
+    return row is not None and row[0] == _signature( filename )
+
+
+class ExportIndex:
+    # Reads single entities of an export via its index (see build_index) without parsing the rest.
+
+    def __init__( self, filename ):
+        self.filename = filename
+        self.connection = sqlite3.connect( index_filename( filename ) )
+        meta = dict( self.connection.execute( 'SELECT key, value FROM meta' ) )
+        self.layout = meta['layout']
+        self.header = loads( meta['header'] )
+        self.file = open( filename, 'rb' )
+
+    def collections( self ):
+        return [name for name, in self.connection.execute( 'SELECT name FROM collections ORDER BY position' )]
+
+    def entity( self, collection, id_ ):
+        row = self.connection.execute( 'SELECT offset, length FROM entities WHERE collection = ? AND id = ?',
+                                       (collection, id_) ).fetchone()
+        return self._read( *row ) if row is not None else None
+
+    def entities( self, collection, subject_ids=None ):
+        # all entities of `collection` (in file order), optionally only those with one of `subject_ids`
+        if subject_ids is None:
+            rows = self.connection.execute(
+                'SELECT offset, length FROM entities WHERE collection = ? ORDER BY offset', (collection,) )
+        else:
+            subject_ids = iter( subject_ids )
+            rows = []
+            while True:
+                batch = list( itertools.islice( subject_ids, BATCH_SIZE ) )
+                if len( batch ) == 0:
+                    break
+                rows += self.connection.execute(
+                    f'SELECT offset, length FROM entities WHERE collection = ? '
+                    f'AND subject_id IN ({", ".join( "?" * len( batch ) )})', [collection, *batch] ).fetchall()
+            rows.sort()
+        for offset, length in rows:
+            yield self._read( offset, length )
+
+    def close( self ):
+        self.connection.close()
+        self.file.close()
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, exc_type, exc_value, traceback ):
+        self.close()
+
+    def _read( self, offset, length ):
+        self.file.seek( offset )
+        value = loads( self.file.read( length ) )
+        return value[1] if self.layout == 'ndjson' else value
@@ -0,0 +1,25 @@
+def dependency_levels( dependencies ):
+    # Topologically sorts `dependencies` (a dict mapping every key to the keys it depends on) into levels:
+    # every key only depends on keys of previous levels, so all keys of one level can be processed concurrently.
+    # Dependencies on unknown keys must be filtered out (or reported) by the caller beforehand.
+    # Returns the levels (in input order) and the keys which cannot be resolved because of a cycle.
+    remaining = {key: len( set( parents ) ) for key, parents in dependencies.items()}
+    children = {key: [] for key in dependencies}
+    for key, parents in dependencies.items():
+        for parent in set( parents ):
+            children[parent].append( key )
+
+    order = {key: i for i, key in enumerate( dependencies )}
+    levels = []
+    level = [key for key, count in remaining.items() if count == 0]
+    while len( level ) > 0:
+        levels.append( level )
+        next_level = []
+        for key in level:
+            del remaining[key]
+            for child in children[key]:
+                remaining[child] -= 1
+                if remaining[child] == 0:
+                    next_level.append( child )
+        level = sorted( next_level, key=lambda key: order[key] )
+    return levels, list( remaining.keys() )
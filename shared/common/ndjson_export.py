@@ -0,0 +1,161 @@
+import itertools
+import os
+
+from shared.common.codec import dumps_compact
+from shared.common.codec import loads
+from shared.common.compression import COMPRESSIONS
+from shared.common.compression import CompressedFile
+from shared.common.compression import compression_of
+
+EXTENSIONS = ('.ndjson', '.jsonl')
+
+# lines parsed with one call of loads
+CHUNK_LINES = 10000
+
+# longest header line we look at when detecting the layout
+MAX_HEADER_LENGTH = 1 << 16
+
+# Layout, one json value per line:
+#     {"exported_on": ..., "api_version": 1, ...}  top-level fields besides "data"
+#     ["activities"]                               start of a collection (also keeps empty ones)
+#     ["activities", {...}]                        one entity
+# Every line stands on its own, so new entities can simply be appended and the file can be split at any line.
+
+
+def is_ndjson_filename( filename ):
+    compression = compression_of( filename )
+    if compression is not None:
+        filename = filename[:-len( COMPRESSIONS[compression][0] )]
+    return filename.endswith( EXTENSIONS )
+
+
+def is_ndjson_file( filename ):
+    # the first line of a json export is either `{` or the whole (compact) document including "data"
+    file = CompressedFile( filename )
+    try:
+        line = file.readline( MAX_HEADER_LENGTH )
+    except UnicodeDecodeError:
+        return False
+    finally:
+        file.close()
+    if not line.endswith( '\n' ):
+        return False
+    try:
+        header = loads( line )
+    except ValueError:
+        return False
+    return isinstance( header, dict ) and 'data' not in header
+
+
+class NdjsonExportWriter:
+    # Same interface as shared.common.export.ExportWriter.
+
+    def __init__( self, filename, header ):
+        self.filename = filename
+        self.temp_filename = f'{filename}.tmp'
+        self.file = CompressedFile( self.temp_filename, 'w', compression_of( filename ) )
+        self.file.write( dumps_compact( header ) + '\n' )
+
+    def write_collection( self, key, entities ):
+        self.file.write( dumps_compact( [key] ) + '\n' )
+        prefix = '[' + dumps_compact( key ) + ','
+        for entity in entities:
+            self.file.write( prefix + dumps_compact( entity ) + ']\n' )
+
+    def commit( self ):
+        self.file.close( sync=True )
+        os.replace( self.temp_filename, self.filename )
+
+    def abort( self ):
+        self.file.close()
+        os.remove( self.temp_filename )
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, exc_type, exc_value, traceback ):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+
+def _parse_lines( filename, first_line, lines ):
+    # one loads for the whole chunk, line by line only to report an error
+    try:
+        records = loads( '[' + ','.join( line for line in lines if line.strip() != '' ) + ']' )
+    except ValueError:
+        records = None
+    if records is None or not all( isinstance( record, list ) and 1 <= len( record ) <= 2 and
+                                   isinstance( record[0], str ) for record in records ):
+        for number, line in enumerate( lines, first_line ):
+            if line.strip() == '':
+                continue
+            try:
+                record = loads( line )
+            except ValueError as e:
+                raise ValueError( f'{filename}:{number}: {e}' )
+            if not isinstance( record, list ) or not 1 <= len( record ) <= 2 or not isinstance( record[0], str ):
+                raise ValueError( f'{filename}:{number}: expected ["<collection>"] or ["<collection>", <entity>]' )
+    return records
+
+
+class NdjsonExportReader:
+    # Same interface as shared.common.export.ExportReader.
+    # `collections()` groups consecutive lines, so a collection which got appended to later shows up twice there,
+    # `load()` merges them.
+
+    def __init__( self, filename ):
+        self.filename = filename
+        self.file = CompressedFile( filename )
+        self.header = loads( self.file.readline() )
+        self.line = 1
+
+    def collections( self ):
+        records = self._records()
+        record = next( records, None )
+
+        def entities( key ):
+            nonlocal record
+            while record is not None and record[0] == key:
+                if len( record ) == 2:
+                    yield record[1]
+                record = next( records, None )
+
+        while record is not None:
+            key = record[0]
+            if len( record ) == 1:
+                record = next( records, None )
+            collection = entities( key )
+            yield key, collection
+            for _ in collection:
+                pass
+
+    def load( self ):
+        data = {}
+        for record in self._records():
+            entities = data.setdefault( record[0], [] )
+            if len( record ) == 2:
+                entities.append( record[1] )
+        return {**self.header, 'data': data}
+
+    def close( self ):
+        self.file.close()
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, exc_type, exc_value, traceback ):
+        self.close()
+
+    def _records( self ):
+        for first_line, lines in self._chunks():
+            yield from _parse_lines( self.filename, first_line, lines )
+
+    def _chunks( self ):
+        while True:
+            lines = list( itertools.islice( self.file, CHUNK_LINES ) )
+            if len( lines ) == 0:
+                return
+            yield self.line + 1, lines
+            self.line += len( lines )
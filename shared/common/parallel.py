@@ -0,0 +1,54 @@
+import concurrent.futures
+
+
+def run_parallel( func, items, jobs=1, on_complete=None, ordered=False, processes=False ):
+    # Calls `func` for every item using at most `jobs` worker threads (worker processes if `processes`,
+    # then `func`, the items and the results must be picklable).
+    # `on_complete` is always called from the calling thread with the result of `func`,
+    # in the order of `items` if `ordered` (results which are done early wait for their predecessors).
+    # The first exception (including SystemExit from verify_response) cancels all pending work and is re-raised.
+    if jobs <= 1:
+        for item in items:
+            result = func( item )
+            if on_complete is not None:
+                on_complete( result )
+        return
+
+    indices = {}
+    results = {}
+    next_index = 0
+
+    def complete( futures ):
+        nonlocal next_index
+        for future in futures:
+            index = indices.pop( future )
+            result = future.result()
+            if ordered:
+                results[index] = result
+            elif on_complete is not None:
+                on_complete( result )
+        while next_index in results:
+            result = results.pop( next_index )
+            next_index += 1
+            if on_complete is not None:
+                on_complete( result )
+
+    executor_class = concurrent.futures.ProcessPoolExecutor if processes else concurrent.futures.ThreadPoolExecutor
+    with executor_class( max_workers=jobs ) as executor:
+        pending = set()
+        try:
+            for index, item in enumerate( items ):
+                # keep the queue bounded instead of submitting every item at once
+                if len( pending ) >= 2 * jobs:
+                    done, pending = concurrent.futures.wait( pending, return_when=concurrent.futures.FIRST_COMPLETED )
+                    complete( done )
+                future = executor.submit( func, item )
+                indices[future] = index
+                pending.add( future )
+            while len( pending ) > 0:
+                done, pending = concurrent.futures.wait( pending, return_when=concurrent.futures.FIRST_COMPLETED )
+                complete( done )
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            raise
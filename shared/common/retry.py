@@ -0,0 +1,77 @@
+import random
+
+from shared.common.codec import DecodeError
+from shared.common.codec import response_json
+from shared.common.throttle import parse_retry_after
+
+DEFAULT_MAX_ATTEMPTS = 5
+
+# transient server or gateway problems, everything else (4xx) is considered fatal
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+# the server rejected these requests without processing them, so they can be repeated even if not idempotent
+# (a 503 only with Retry-After, a proxy also sends it after the backend committed)
+REJECTED_STATUS_CODES = {429}
+
+# the entity of a create with a client-chosen id already exists
+DUPLICATE_STATUS_CODES = {409}
+
+
+def is_idempotent( method, json=None ):
+    # POSTs with an id token create entities with client-chosen ids, so repeating them cannot create duplicates
+    if method in ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'):
+        return True
+    if method == 'POST':
+        if isinstance( json, dict ):
+            return 'id_token' in json
+        if isinstance( json, list ):
+            return len( json ) > 0 and all( isinstance( item, dict ) and 'id_token' in item for item in json )
+    return False
+
+
+def _has_client_id( item ):
+    return isinstance( item, dict ) and 'id_token' in item and 'id' in item
+
+
+def is_duplicate_create( method, json, r ):
+    # whether `r` rejects a POST with client-chosen ids (one entity or a batch) because an entity with such an id
+    # exists
+    if method != 'POST':
+        return False
+    if isinstance( json, list ):
+        if len( json ) == 0 or not all( _has_client_id( item ) for item in json ):
+            return False
+    elif not _has_client_id( json ):
+        return False
+    if r.status_code in DUPLICATE_STATUS_CODES:
+        return True
+    if not (400 <= r.status_code < 500):
+        return False
+    try:
+        js = response_json( r )
+    except DecodeError:
+        return 'already exist' in r.text.lower()
+    return isinstance( js, dict ) and 'already exist' in str( js.get( 'message', '' ) ).lower()
+
+
+class RetryPolicy:
+    def __init__( self, max_attempts=DEFAULT_MAX_ATTEMPTS, backoff=0.5, max_backoff=30.0 ):
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def should_retry( self, attempt, status_code, idempotent, retry_after=None ):
+        if attempt >= self.max_attempts:
+            return False
+        if status_code is None:
+            return idempotent
+        if status_code in REJECTED_STATUS_CODES or (status_code == 503 and retry_after is not None):
+            return True
+        return idempotent and status_code in RETRYABLE_STATUS_CODES
+
+    def delay( self, attempt, retry_after=None ):
+        # exponential backoff with full jitter, but never shorter than the server asked for
+        delay = random.uniform( 0, min( self.max_backoff, self.backoff * 2 ** attempt ) )
+        if retry_after is not None:
+            delay = max( delay, parse_retry_after( retry_after ) )
+        return delay
@@ -0,0 +1,145 @@
+import datetime
+import hashlib
+import itertools
+import sqlite3
+
+from shared.common.codec import dumps
+from shared.common.codec import dumps_compact
+from shared.common.codec import loads
+from shared.common.utils import date_to_string
+
+HASH_SIZE = 16
+
+# objects looked up with one query when restoring
+LOOKUP_BATCH_SIZE = 500
+
+# Every entity is stored once in `objects`, keyed by the hash of its (compact) json.
+# A snapshot only lists the hashes of its entities, per collection and in their original order:
+#     objects( hash, json )
+#     snapshots( id, name, created_on, header )                     header: top-level fields besides "data"
+#     snapshot_collections( snapshot_id, position, name, hashes )  hashes: concatenated HASH_SIZE byte digests
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS objects (hash BLOB PRIMARY KEY, json TEXT NOT NULL) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS snapshots (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL, created_on TEXT NOT NULL,
+                                      header TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS snapshot_collections (snapshot_id INTEGER NOT NULL REFERENCES snapshots (id),
+                                                 position INTEGER NOT NULL, name TEXT NOT NULL, hashes BLOB NOT NULL,
+                                                 PRIMARY KEY (snapshot_id, position));
+'''
+
+
+def _hash( text ):
+    return hashlib.blake2b( text.encode(), digest_size=HASH_SIZE ).digest()
+
+
+class SnapshotStore:
+    def __init__( self, filename ):
+        self.connection = sqlite3.connect( filename )
+        self.connection.executescript( SCHEMA )
+
+    def create( self, reader, name=None ):
+        # `reader` is anything like shared.common.export.ExportReader, `name` defaults to the export date.
+        # Returns (name, entities, newly stored objects), raises ValueError if the name is taken.
+        stored = 0
+        manifest = []
+        with self.connection:
+            for key, collection in reader.collections():
+                hashes = []
+
+                def objects():
+                    for entity in collection:
+                        text = dumps_compact( entity )
+                        hashes.append( _hash( text ) )
+                        yield hashes[-1], text
+
+                stored += self.connection.executemany( 'INSERT OR IGNORE INTO objects (hash, json) VALUES (?, ?)',
+                                                       objects() ).rowcount
+                manifest.append( (key, b''.join( hashes )) )
+
+            # the reader only knows all top-level fields after reading everything
+            created_on = date_to_string( datetime.datetime.utcnow() )
+            if name is None:
+                name = reader.header.get( 'exported_on', created_on )
+            if self.exists( name ):
+                raise ValueError( f'snapshot {name} already exists' )
+            cursor = self.connection.execute( 'INSERT INTO snapshots (name, created_on, header) VALUES (?, ?, ?)',
+                                              (name, created_on, dumps( reader.header )) )
+            self.connection.executemany(
+                'INSERT INTO snapshot_collections (snapshot_id, position, name, hashes) VALUES (?, ?, ?, ?)',
+                [(cursor.lastrowid, position, key, hashes) for position, (key, hashes) in enumerate( manifest )] )
+        entities = sum( len( hashes ) // HASH_SIZE for _, hashes in manifest )
+        return name, entities, stored
+
+    def exists( self, name ):
+        return self._snapshot_id( name ) is not None
+
+    def snapshots( self ):
+        # [(name, created_on, header, {collection: count})] from oldest to newest
+        result = []
+        for snapshot_id, name, created_on, header in self.connection.execute(
+                'SELECT id, name, created_on, header FROM snapshots ORDER BY id' ):
+            counts = {key: count for key, count in self.connection.execute(
+                'SELECT name, length( hashes ) / ? FROM snapshot_collections WHERE snapshot_id = ? ORDER BY position',
+                (HASH_SIZE, snapshot_id) )}
+            result.append( (name, created_on, loads( header ), counts) )
+        return result
+
+    def header( self, name ):
+        header, = self.connection.execute( 'SELECT header FROM snapshots WHERE id = ?',
+                                           (self._snapshot_id( name ),) ).fetchone()
+        return loads( header )
+
+    def collections( self, name ):
+        # yields (key, entities) like shared.common.export.ExportReader
+        rows = self.connection.execute(
+            'SELECT name, hashes FROM snapshot_collections WHERE snapshot_id = ? ORDER BY position',
+            (self._snapshot_id( name ),) ).fetchall()
+        for key, hashes in rows:
+            yield key, self._entities( hashes )
+
+    def delete( self, name ):
+        snapshot_id = self._snapshot_id( name )
+        with self.connection:
+            self.connection.execute( 'DELETE FROM snapshot_collections WHERE snapshot_id = ?', (snapshot_id,) )
+            self.connection.execute( 'DELETE FROM snapshots WHERE id = ?', (snapshot_id,) )
+
+    def collect_garbage( self ):
+        # removes all objects no snapshot refers to anymore, returns their number
+        stored = self._object_count()
+        with self.connection:
+            self.connection.execute( 'CREATE TEMPORARY TABLE referenced (hash BLOB PRIMARY KEY) WITHOUT ROWID' )
+            for hashes, in self.connection.execute( 'SELECT hashes FROM snapshot_collections' ).fetchall():
+                self.connection.executemany( 'INSERT OR IGNORE INTO referenced (hash) VALUES (?)',
+                                             ((hashes[i:i + HASH_SIZE],) for i in range( 0, len( hashes ), HASH_SIZE )) )
+            self.connection.execute( 'DELETE FROM objects WHERE hash NOT IN (SELECT hash FROM referenced)' )
+            self.connection.execute( 'DROP TABLE referenced' )
+        removed = stored - self._object_count()
+        self.connection.execute( 'VACUUM' )
+        return removed
+
+    def close( self ):
+        self.connection.close()
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, exc_type, exc_value, traceback ):
+        self.close()
+
+    def _snapshot_id( self, name ):
+        row = self.connection.execute( 'SELECT id FROM snapshots WHERE name = ?', (name,) ).fetchone()
+        return row[0] if row is not None else None
+
+    def _object_count( self ):
+        return self.connection.execute( 'SELECT count(*) FROM objects' ).fetchone()[0]
+
+    def _entities( self, hashes ):
+        digests = (hashes[i:i + HASH_SIZE] for i in range( 0, len( hashes ), HASH_SIZE ))
+        while True:
+            batch = list( itertools.islice( digests, LOOKUP_BATCH_SIZE ) )
+            if len( batch ) == 0:
+                return
+            texts = dict( self.connection.execute(
+                f'SELECT hash, json FROM objects WHERE hash IN ({", ".join( "?" * len( batch ) )})', batch ) )
+            for digest in batch:
+                yield loads( texts[digest] )
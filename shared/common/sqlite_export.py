@@ -0,0 +1,158 @@
+import os
+import sqlite3
+
+from shared.common.codec import dumps
+from shared.common.codec import dumps_compact
+from shared.common.codec import loads
+
+EXTENSIONS = ('.sqlite', '.sqlite3', '.db')
+MAGIC = b'SQLite format 3\x00'
+
+# entity fields which get their own (indexed) column
+INDEXED_FIELDS = ('id', 'subject_id', 'start')
+# collection: (table, list field, column), a row with the position of the entity for every item of the list
+JUNCTION_TABLES = {
+    'activities': ('activity_subjects', 'subject_ids', 'subject_id'),
+}
+
+# Layout:
+#     _meta( position, key, value )   top-level fields besides "data", values as json
+#     _collections( position, name )  collections in their original order
+#     "<collection>"( position, id, subject_id, start, json )  one table per collection, entities as json
+#     activity_subjects( position, subject_id )  the subject_ids of the activities
+# The json columns keep every entity as it was, the other columns and tables only exist for queries like
+#     SELECT a.json FROM activities a JOIN activity_subjects s ON s.position = a.position
+#     WHERE s.subject_id = ? AND a.start >= ?
+
+
+def is_sqlite_filename( filename ):
+    return filename.endswith( EXTENSIONS )
+
+
+def is_sqlite_file( filename ):
+    with open( filename, 'rb' ) as f:
+        return f.read( len( MAGIC ) ) == MAGIC
+
+
+def _quote( name ):
+    return '"' + name.replace( '"', '""' ) + '"'
+
+
+class SqliteExportWriter:
+    # Same interface as shared.common.export.ExportWriter.
+
+    def __init__( self, filename, header ):
+        self.filename = filename
+        self.temp_filename = f'{filename}.tmp'
+        if os.path.exists( self.temp_filename ):
+            os.remove( self.temp_filename )
+        self.connection = sqlite3.connect( self.temp_filename )
+        # nothing to protect in the temporary file, it gets synced once on commit
+        self.connection.execute( 'PRAGMA journal_mode = OFF' )
+        self.connection.execute( 'PRAGMA synchronous = OFF' )
+        self.connection.execute( 'CREATE TABLE _meta (position INTEGER PRIMARY KEY, key TEXT UNIQUE NOT NULL, '
+                                 'value TEXT NOT NULL)' )
+        self.connection.execute( 'CREATE TABLE _collections (position INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL)' )
+        self.connection.executemany( 'INSERT INTO _meta (key, value) VALUES (?, ?)',
+                                     [(key, dumps( value )) for key, value in header.items()] )
+        self.tables = []
+        self.junction_tables = []
+
+    def write_collection( self, key, entities ):
+        table = _quote( key )
+        self.connection.execute( 'INSERT INTO _collections (name) VALUES (?)', (key,) )
+        columns = ', '.join( INDEXED_FIELDS )
+        placeholders = ', '.join( '?' * (len( INDEXED_FIELDS ) + 2) )
+        # no type affinity for the indexed columns, so that ids keep their type
+        self.connection.execute( f'CREATE TABLE {table} (position INTEGER PRIMARY KEY, {columns}, json TEXT NOT NULL)' )
+        junction = JUNCTION_TABLES.get( key )
+        links = []
+
+        def rows():
+            for position, entity in enumerate( entities, 1 ):
+                if junction is not None:
+                    links.extend( (position, value) for value in _list_column( entity, junction[1] ) )
+                yield position, *(_column( entity, field ) for field in INDEXED_FIELDS), dumps_compact( entity )
+
+        self.connection.executemany( f'INSERT INTO {table} (position, {columns}, json) VALUES ({placeholders})',
+                                     rows() )
+        self.tables.append( key )
+        if junction is not None:
+            junction_table, _, column = junction
+            self.connection.execute( f'CREATE TABLE {_quote( junction_table )} (position INTEGER NOT NULL, {column})' )
+            self.connection.executemany( f'INSERT INTO {_quote( junction_table )} (position, {column}) VALUES (?, ?)',
+                                         links )
+            self.junction_tables.append( junction )
+
+    def commit( self ):
+        # indexes are cheaper to build after inserting everything
+        for key in self.tables:
+            for field in INDEXED_FIELDS:
+                if field == 'id' or self.connection.execute(
+                        f'SELECT 1 FROM {_quote( key )} WHERE {field} IS NOT NULL LIMIT 1' ).fetchone() is not None:
+                    self.connection.execute( f'CREATE INDEX {_quote( f"{key}_{field}" )} ON {_quote( key )} ({field})' )
+        for junction_table, _, column in self.junction_tables:
+            self.connection.execute( f'CREATE INDEX {_quote( f"{junction_table}_{column}" )} '
+                                     f'ON {_quote( junction_table )} ({column}, position)' )
+        self.connection.commit()
+        self.connection.close()
+        with open( self.temp_filename, 'rb' ) as f:
+            os.fsync( f.fileno() )
+        os.replace( self.temp_filename, self.filename )
+
+    def abort( self ):
+        self.connection.close()
+        os.remove( self.temp_filename )
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, exc_type, exc_value, traceback ):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+
+def _column( entity, field ):
+    value = entity.get( field ) if isinstance( entity, dict ) else None
+    # nested values are only kept in the json column
+    return value if isinstance( value, (str, int, float) ) else None
+
+
+def _list_column( entity, field ):
+    values = entity.get( field ) if isinstance( entity, dict ) else None
+    if not isinstance( values, list ):
+        return []
+    return [value for value in values if isinstance( value, (str, int, float) )]
+
+
+class SqliteExportReader:
+    # Same interface as shared.common.export.ExportReader, entities get read one by one from the database.
+
+    def __init__( self, filename ):
+        self.filename = filename
+        self.connection = sqlite3.connect( filename )
+        self.header = {key: loads( value )
+                       for key, value in self.connection.execute( 'SELECT key, value FROM _meta ORDER BY position' )}
+
+    def collections( self ):
+        names = [name for name, in self.connection.execute( 'SELECT name FROM _collections ORDER BY position' )]
+        for name in names:
+            yield name, self._entities( name )
+
+    def load( self ):
+        return {**self.header, 'data': {key: list( entities ) for key, entities in self.collections()}}
+
+    def close( self ):
+        self.connection.close()
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, exc_type, exc_value, traceback ):
+        self.close()
+
+    def _entities( self, name ):
+        for value, in self.connection.execute( f'SELECT json FROM {_quote( name )} ORDER BY position' ):
+            yield loads( value )
@@ -0,0 +1,87 @@
+import collections
+import email.utils
+import threading
+import time
+
+OVERLOAD_STATUS_CODES = {429, 503}
+
+
+def parse_retry_after( value, default=1.0 ):
+    if value is None:
+        return default
+    try:
+        return max( 0.0, float( value ) )
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime( value )
+    except (TypeError, ValueError):
+        return default
+    return max( 0.0, date.timestamp() - time.time() )
+
+
+class AdaptiveLimiter:
+    # AIMD controller for the number of requests in flight:
+    # - additive increase: +1 after `limit` successful requests while the last p95 latency check found it flat
+    # - multiplicative decrease: halve on 429/503 or if the p95 latency rises above `tolerance` times its baseline
+    # - all requests pause while a `Retry-After` from the server is pending
+
+    def __init__( self, max_limit, min_limit=1, window=50, tolerance=1.5 ):
+        self.max_limit = max_limit
+        self.min_limit = min( min_limit, max_limit )
+        self.limit = float( max( self.min_limit, max_limit // 4 ) )
+        self.window = window
+        self.tolerance = tolerance
+        self.in_flight = 0
+        self.latencies = collections.deque( maxlen=window )
+        self.baseline = None
+        # whether the last p95 check allows increasing the limit
+        self.increasing = False
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.condition = threading.Condition()
+
+    def acquire( self ):
+        with self.condition:
+            while True:
+                delay = self.paused_until - time.monotonic()
+                if delay > 0:
+                    self.condition.wait( delay )
+                elif self.in_flight < int( self.limit ):
+                    self.in_flight += 1
+                    return
+                else:
+                    self.condition.wait()
+
+    def release( self, latency, status_code=None, retry_after=None ):
+        with self.condition:
+            self.in_flight -= 1
+            if status_code in OVERLOAD_STATUS_CODES:
+                self._decrease()
+                self.paused_until = max( self.paused_until, time.monotonic() + parse_retry_after( retry_after ) )
+            elif status_code is not None and status_code < 500:
+                self._record( latency )
+            self.condition.notify_all()
+
+    def _record( self, latency ):
+        self.latencies.append( latency )
+        if len( self.latencies ) >= self.window:
+            p95 = sorted( self.latencies )[int( 0.95 * (len( self.latencies ) - 1) )]
+            self.latencies.clear()
+            if self.baseline is None:
+                self.baseline = p95
+            self.increasing = p95 <= self.tolerance * self.baseline
+            if self.increasing:
+                self.baseline = 0.9 * self.baseline + 0.1 * p95
+            else:
+                self._decrease()
+        if self.increasing:
+            self.limit = min( self.max_limit, self.limit + 1 / self.limit )
+
+    def _decrease( self ):
+        # requests already in flight when we backed off will report the same overload, so decrease once per window
+        now = time.monotonic()
+        if now - self.last_decrease < (self.baseline or 1.0):
+            return
+        self.last_decrease = now
+        self.limit = max( float( self.min_limit ), self.limit / 2 )
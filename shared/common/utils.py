@@ -1,8 +1,9 @@
-import json
 import sys
 import datetime
 
-import simplejson
+from shared.common.codec import DecodeError
+from shared.common.codec import dumps_pretty
+from shared.common.codec import response_json
 
 
 def print_err( *args, **kwargs ):
@@ -10,7 +11,7 @@ def print_err( *args, **kwargs ):
 
 
 def pretty_json( ugly ):
-    return json.dumps( ugly, indent=4, sort_keys=False )
+    return dumps_pretty( ugly )
 
 
 def date_to_string( date ):
@@ -27,15 +28,33 @@ def verify_response( r, data=None ):
         if data is not None:
             print_err( '\n'.join( [f'> {line}' for line in pretty_json( data ).split( '\n' )] ) )
         try:
-            js = r.json()
+            js = response_json( r )
             if 'message' in js:
                 print_err( str( r.status_code ) + ' ' + js['message'] )
             else:
                 print_err( str( r.status_code ) + ':\n' + pretty_json( js ) )
-        except simplejson.errors.JSONDecodeError:
+        except DecodeError:
             print_err( str( r.status_code ) + ':\n' + r.text )
         sys.exit( 1 )
 
 
 def simple_changeset_to_list( data ):
     return [x['data'] for x in data['changeset']]
+
+
+def is_deletion( change ):
+    # ASSUMPTION, not checked against the server yet: deltas mark deleted entities like this
+    return change.get( 'deleted', False ) or change.get( 'type' ) == 'delete'
+
+
+def merge_changeset( entities, data ):
+    # Applies a changeset (created, changed or deleted entities) to a list of entities.
+    # Changed entities keep their position, created ones get appended.
+    merged = {entity['id']: entity for entity in entities}
+    for change in data['changeset']:
+        entity = change['data']
+        if is_deletion( change ):
+            merged.pop( entity['id'], None )
+        else:
+            merged[entity['id']] = entity
+    return list( merged.values() )
@@ -2,10 +2,9 @@ import getpass
 import hashlib
 import sys
 
-import requests
-
 from shared.common.auth import explain_first_request_exception
-from shared.common.auth import request_kwargs
+from shared.common.client import client
+from shared.common.codec import response_json
 from shared.common.utils import verify_response
 
 
@@ -19,18 +18,18 @@ def login( url, email, username, password ):
 
     print( 'Authenticating...' )
     try:
-        r = requests.post( f'{url}/auth/login', json=data, **request_kwargs() )
+        r = client.post( f'{url}/auth/login', json=data )
     except Exception as e:
         explain_first_request_exception(e)
         sys.exit( 1 )
     verify_response( r, data )
-    payload = r.json()['data']
+    payload = response_json( r )['data']
     return payload['access_token'], payload['refresh_token'], payload['id']
 
 
 def logout( url, access_token, refresh_token ):
     print( 'Signing out...' )
-    r = requests.delete( f'{url}/auth/revoke-access', **request_kwargs( access_token ) )
+    r = client.delete( f'{url}/auth/revoke-access', token=access_token )
     verify_response( r )
-    r = requests.delete( f'{url}/auth/revoke-refresh', **request_kwargs( refresh_token ) )
+    r = client.delete( f'{url}/auth/revoke-refresh', token=refresh_token )
     verify_response( r )
@@ -1,6 +1,4 @@
-import requests
-
-from shared.common.auth import request_kwargs
+from shared.common.client import client
 from shared.common.utils import verify_response
 
 
@@ -10,5 +8,5 @@ def clear_data( url, token, skip_warning ):
         print( f'         on {url}' )
         input( 'Press Enter to continue' )
     print( 'Removing data...' )
-    r = requests.delete( f'{url}/batch/all-private', **request_kwargs( token ) )
+    r = client.delete( f'{url}/batch/all-private', token=token )
     verify_response( r )
\ No newline at end of file
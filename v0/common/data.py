@@ -1,6 +1,6 @@
-import json
+from shared.common.export import ExportReader
 
 
 def load_data( filename ):
-    with open( filename ) as jsonfile:
-        return json.load( jsonfile )
\ No newline at end of file
+    with ExportReader( filename ) as reader:
+        return reader.load()
@@ -1,16 +1,32 @@
 import sys
 
+from shared.common.client import DEFAULT_POOL_SIZE
+from shared.common.client import DEFAULT_TIMEOUT
+from shared.common.client import client
+from shared.common.retry import DEFAULT_MAX_ATTEMPTS
 from shared.common.utils import print_err
 
 
-def add_default_arguments( parser, with_y=False ):
+def add_default_arguments( parser, with_y=False, with_jobs=False ):
     parser.add_argument( '--api', metavar='URL', type=str, help='default: %(default)s',
                          default='https://time.nevees.org/api' )
     parser.add_argument( '-e', metavar='EMAIL', type=str, help='email or username must be given' )
     parser.add_argument( '-u', metavar='USERNAME', type=str, help='email or username must be given' )
     parser.add_argument( '-p', metavar='PASSWORD', type=str, help='if not given you get prompted' )
+    parser.add_argument( '--timeout', metavar='SECONDS', type=float, help='request timeout, default: %(default)s',
+                         default=DEFAULT_TIMEOUT )
+    parser.add_argument( '--pool-size', metavar='N', type=int, help='kept-alive connections, default: %(default)s',
+                         default=DEFAULT_POOL_SIZE )
+    parser.add_argument( '--attempts', metavar='N', type=int,
+                         help='attempts for idempotent requests on transient failures, default: %(default)s',
+                         default=DEFAULT_MAX_ATTEMPTS )
     if with_y:
         parser.add_argument( '-y', action='store_true', help='skip warning notice' )
+    if with_jobs:
+        parser.add_argument( '--jobs', '-j', metavar='N', type=int, help='parallel requests, default: %(default)s',
+                             default=1 )
+        parser.add_argument( '--adaptive', action='store_true',
+                             help='adapt parallel requests (up to --jobs) to server latency and overload responses' )
 
 
 def verify_default_arguments( args ):
@@ -21,3 +37,18 @@ def verify_default_arguments( args ):
     if args.e is not None and args.u is not None:
         print_err( '-e and -u are mutually exclusive.' )
         sys.exit( 1 )
+
+    if args.pool_size < 1:
+        print_err( '--pool-size must be at least 1.' )
+        sys.exit( 1 )
+
+    if args.attempts < 1:
+        print_err( '--attempts must be at least 1.' )
+        sys.exit( 1 )
+
+    jobs = getattr( args, 'jobs', 1 )
+    if jobs < 1:
+        print_err( '--jobs must be at least 1.' )
+        sys.exit( 1 )
+
+    client.configure( max( args.pool_size, jobs ), args.timeout, getattr( args, 'adaptive', False ), args.attempts, jobs )
@@ -0,0 +1,178 @@
+import csv
+import datetime
+import heapq
+import io
+import re
+
+# bytes read at once when counting lines, and the approximate size of the chunks validated in parallel
+SCAN_CHUNK_SIZE = 1 << 20
+VALIDATE_CHUNK_SIZE = 4 << 20
+
+COLUMNS = ('start', 'end', 'location', 'subject parent', 'subject', 'comment')
+REQUIRED_COLUMNS = 5
+
+EPOCH = datetime.datetime( 1970, 1, 1 )
+MILLISECOND = datetime.timedelta( milliseconds=1 )
+
+# the formats normalized_date completes
+DATE_PATTERN = re.compile( r'\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}(\.\d{3})?' )
+
+
+def normalized_date( csv_date ):
+    date = csv_date.replace( ' ', 'T' )
+    if len( date ) == 19:
+        date += '.000Z'
+    elif len( date ) == 23:
+        date += 'Z'
+    return date
+
+
+def activity_of( row ):
+    return {
+        'start': normalized_date( row[0] ),
+        'end': normalized_date( row[1] ),
+        'subject_parent_name': row[3],
+        'subject_name': row[4],
+        'location_name': row[2],
+        **({'data': {"comment": row[5]}} if len( row ) > 5 and row[5] != '' else {})
+    }
+
+
+def tsv_reader( file ):
+    return csv.reader( file, delimiter='\t', quotechar='"' )
+
+
+def count_lines( filename ):
+    # only scans for newlines instead of parsing, rows with quoted line breaks count more than once
+    count = 0
+    last = b'\n'
+    with open( filename, 'rb' ) as f:
+        while True:
+            chunk = f.read( SCAN_CHUNK_SIZE )
+            if chunk == b'':
+                break
+            count += chunk.count( b'\n' )
+            last = chunk[-1:]
+    return count + (1 if last != b'\n' else 0)
+
+
+def read_activities( filenames ):
+    # streams the activities of all files, one after another
+    for filename in filenames:
+        with open( filename, newline='' ) as csvfile:
+            for row in tsv_reader( csvfile ):
+                yield activity_of( row )
+
+
+def split_file( filename, chunk_size=VALIDATE_CHUNK_SIZE ):
+    # Yields (filename, first line number, bytes) with whole rows of about `chunk_size` bytes.
+    # A chunk only ends where the csv parser finished a row, counting quote characters is not enough
+    # (e.g. an unquoted field may contain a single quote). The parser pulls the lines one by one, so after every
+    # row it got exactly the lines of the complete rows so far.
+    # latin-1 keeps every byte as one character, the separators and quote characters are the same as in utf-8.
+    parts = []
+    size = 0
+
+    def lines( file ):
+        nonlocal size
+        for part in file:
+            parts.append( part )
+            size += len( part )
+            yield part
+
+    line = 1
+    with open( filename, encoding='latin-1', newline='' ) as f:
+        reader = tsv_reader( lines( f ) )
+        while True:
+            try:
+                next( reader )
+            except StopIteration:
+                break
+            except csv.Error:
+                # the parser starts over with the next line, just like validate_chunk does
+                pass
+            if size >= chunk_size:
+                data = ''.join( parts ).encode( 'latin-1' )
+                yield filename, line, data
+                line += data.count( b'\n' )
+                parts.clear()
+                size = 0
+    if len( parts ) > 0:
+        yield filename, line, ''.join( parts ).encode( 'latin-1' )
+
+
+def _parse_date( value ):
+    if DATE_PATTERN.fullmatch( value ) is None:
+        return None
+    # milliseconds since the epoch (of the naive time), integers take less memory than the strings
+    try:
+        return (datetime.datetime.fromisoformat( value ) - EPOCH) // MILLISECOND
+    except ValueError:
+        return None
+
+
+def validate_chunk( chunk, known_locations=None ):
+    # Checks every row of a chunk (see split_file).
+    # Returns (rows, problems, intervals) with problems as (filename, line, message) and the intervals
+    # (start, end, filename, line) of the valid rows sorted by start, for find_overlaps.
+    filename, first_line, data = chunk
+    problems = []
+    intervals = []
+    try:
+        text = data.decode( 'utf-8' )
+    except UnicodeDecodeError as e:
+        return 0, [(filename, first_line + data.count( b'\n', 0, e.start ), 'is not valid utf-8')], []
+    reader = tsv_reader( io.StringIO( text, newline='' ) )
+    rows = 0
+    line = first_line
+    while True:
+        try:
+            row = next( reader )
+        except StopIteration:
+            break
+        except csv.Error as e:
+            # the parser skips the rest of the row and continues with the next line
+            problems.append( (filename, first_line + reader.line_num - 1, str( e )) )
+            line = first_line + reader.line_num
+            continue
+        rows += 1
+        row_line = line
+        line = first_line + reader.line_num
+
+        def problem( message ):
+            problems.append( (filename, row_line, message) )
+
+        if len( row ) < REQUIRED_COLUMNS:
+            problem( f'expected at least {REQUIRED_COLUMNS} columns ({", ".join( COLUMNS[:REQUIRED_COLUMNS] )}), '
+                     f'got {len( row )}' )
+            continue
+        start = _parse_date( row[0] )
+        end = _parse_date( row[1] )
+        if start is None:
+            problem( f'invalid start {row[0]!r}' )
+        if end is None:
+            problem( f'invalid end {row[1]!r}' )
+        if row[4] == '':
+            problem( 'empty subject' )
+        if known_locations is not None and row[2] not in known_locations:
+            problem( f'unknown location {row[2]!r}' )
+        if start is not None and end is not None:
+            if end < start:
+                problem( f'ends ({row[1]}) before it starts ({row[0]})' )
+            else:
+                intervals.append( (start, end, filename, row_line) )
+    intervals.sort()
+    return rows, problems, intervals
+
+
+def find_overlaps( sorted_intervals ):
+    # `sorted_intervals` are lists of (start, end, filename, line), each sorted by start.
+    # Returns (filename, line, message) for every activity which starts before an earlier one ended.
+    problems = []
+    latest = None
+    for start, end, filename, line in heapq.merge( *sorted_intervals ):
+        if latest is not None and start < latest[0]:
+            problems.append( (filename, line, f'overlaps the activity at {latest[1]}:{latest[2]}') )
+        if latest is None or end > latest[0]:
+            latest = (end, filename, line)
+    return problems
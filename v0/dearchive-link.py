@@ -3,11 +3,10 @@
 import argparse
 import sys
 
-import requests
-
-from shared.common.auth import request_kwargs
+from shared.common.client import client
 from v0.common.auth import login
 from v0.common.auth import logout
+from shared.common.codec import response_json
 from shared.common.utils import simple_changeset_to_list
 from shared.common.utils import verify_response
 from v0.common.parser import add_default_arguments
@@ -15,13 +14,13 @@ from v0.common.parser import verify_default_arguments
 
 
 def fetch_profile( url, token, user_id ):
-    r = requests.get( f'{url}/user/{user_id}', **request_kwargs( token ) )
+    r = client.get( f'{url}/user/{user_id}', token=token )
     verify_response( r )
-    return simple_changeset_to_list( r.json() )[0]
+    return simple_changeset_to_list( response_json( r ) )[0]
 
 
 def update_profile( url, token, user_id, data ):
-    r = requests.put( f'{url}/user/{user_id}', json=data, **request_kwargs( token ) )
+    r = client.put( f'{url}/user/{user_id}', json=data, token=token )
     verify_response( r )
 
 
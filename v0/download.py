@@ -2,14 +2,16 @@
 
 import argparse
 import datetime
-import json
 import os
 import sys
 
 import progress.bar
-import requests
 
-from shared.common.auth import request_kwargs
+from shared.common.client import client
+from shared.common.codec import response_json
+from shared.common.export import DEFAULT_INDENT
+from shared.common.export import ExportWriter
+from shared.common.parallel import run_parallel
 from shared.common.utils import date_to_string
 from shared.common.utils import simple_changeset_to_list
 from shared.common.utils import verify_response
@@ -20,82 +22,83 @@ from v0.common.parser import verify_default_arguments
 
 
 def fetch_users( url, token ):
-    r = requests.get( f'{url}/user/all', **request_kwargs( token ) )
+    r = client.get( f'{url}/user/all', token=token )
     verify_response( r )
-    return simple_changeset_to_list( r.json() )
+    return simple_changeset_to_list( response_json( r ) )
 
 
 def fetch_organizations( url, token ):
-    r = requests.get( f'{url}/organization/', **request_kwargs( token ) )
+    r = client.get( f'{url}/organization/', token=token )
     verify_response( r )
-    return simple_changeset_to_list( r.json() )
+    return simple_changeset_to_list( response_json( r ) )
 
 
 def fetch_subjects( url, token ):
-    r = requests.get( f'{url}/subject/', **request_kwargs( token ) )
+    r = client.get( f'{url}/subject/', token=token )
     verify_response( r )
-    return simple_changeset_to_list( r.json() )
+    return simple_changeset_to_list( response_json( r ) )
 
 
 def fetch_locations( url, token ):
-    r = requests.get( f'{url}/location/', **request_kwargs( token ) )
+    r = client.get( f'{url}/location/', token=token )
     verify_response( r )
-    return simple_changeset_to_list( r.json() )
+    return simple_changeset_to_list( response_json( r ) )
 
 
 def fetch_activities( url, token ):
-    r = requests.get( f'{url}/activity/', **request_kwargs( token ) )
+    r = client.get( f'{url}/activity/', token=token )
     verify_response( r )
-    return simple_changeset_to_list( r.json() )
-
-
-def fetch_data( url, token ):
-    bar = progress.bar.Bar( f'Downloading...', max=5 )
-    users = fetch_users( url, token )
-    bar.next()
-    organizations = fetch_organizations( url, token )
-    bar.next()
-    subjects = fetch_subjects( url, token )
-    bar.next()
-    locations = fetch_locations( url, token )
-    bar.next()
-    activities = fetch_activities( url, token )
-    bar.next()
-    bar.finish()
-    return {
-        'users': users,
-        'organizations': organizations,
-        'subjects': subjects,
-        'locations': locations,
-        'activities': activities,
-    }
+    return simple_changeset_to_list( response_json( r ) )
 
 
-def export_data( url, token, filename, skip_warning, user_id ):
-    data = {
-        'exported_on': date_to_string( datetime.datetime.utcnow() ),
-        'user_id': user_id,
-        'data': fetch_data( url, token ),
-    }
+FETCHERS = {
+    'users': fetch_users,
+    'organizations': fetch_organizations,
+    'subjects': fetch_subjects,
+    'locations': fetch_locations,
+    'activities': fetch_activities,
+}
+
+
+def stream_data( url, token, on_fetched, jobs=1 ):
+    # calls `on_fetched( key, entities )` for every collection in the order of FETCHERS
+    def on_complete( item ):
+        bar.next()
+        on_fetched( *item )
 
+    bar = progress.bar.Bar( f'Downloading...', max=len( FETCHERS ) )
+    run_parallel( lambda key: (key, FETCHERS[key]( url, token )), list( FETCHERS.keys() ), jobs, on_complete,
+                  ordered=True )
+    bar.finish()
+
+
+def export_data( url, token, filename, skip_warning, user_id, jobs=1, indent=DEFAULT_INDENT ):
     if os.path.exists( filename ) and not skip_warning:
         print( f'WARNING: {filename} already exists' )
         print( f'         and will get overridden' )
         input( 'Press Enter to continue' )
-    json.dump( data, open( filename, 'w' ), indent=4, sort_keys=False )
+
+    header = {
+        'exported_on': date_to_string( datetime.datetime.utcnow() ),
+        'user_id': user_id,
+    }
+    with ExportWriter( filename, header, indent ) as writer:
+        stream_data( url, token, writer.write_collection, jobs )
 
 
 def main():
     parser = argparse.ArgumentParser( description='Export Beaverlog data.' )
-    add_default_arguments( parser, with_y=True )
-    parser.add_argument( 'output', metavar='OUTPUT', type=str, help='target json file' )
+    add_default_arguments( parser, with_y=True, with_jobs=True )
+    parser.add_argument( '--compact', action='store_true', help='write the json without indentation' )
+    parser.add_argument( 'output', metavar='OUTPUT', type=str, help='target json file (.gz, .bz2, .xz: compressed)' )
 
     args = parser.parse_args()
     verify_default_arguments( args )
 
     access_token, refresh_token, user_id = login( args.api, args.e, args.u, args.p )
     try:
-        export_data( args.api, access_token, args.output, args.y, user_id )
+        export_data( args.api, access_token, args.output, args.y, user_id, args.jobs,
+                     None if args.compact else DEFAULT_INDENT )
     finally:
         logout( args.api, access_token, refresh_token )
 
@@ -6,16 +6,20 @@ import enum
 import sys
 
 import progress.bar
-import requests
 
-from shared.common.auth import request_kwargs
+from shared.common.client import client
+from shared.common.codec import response_json
+from shared.common.export import ExportReader
+from shared.common.export_index import ExportIndex
+from shared.common.export_index import build_index
+from shared.common.export_index import is_index_current
 from v0.common.auth import login
 from v0.common.auth import logout
 from shared.common.utils import date_to_string
+from shared.common.utils import print_err
 from shared.common.utils import simple_changeset_to_list
 from shared.common.utils import string_to_date
 from shared.common.utils import verify_response
-from v0.common.data import load_data
 from v0.common.parser import add_default_arguments
 from v0.common.parser import verify_default_arguments
 
@@ -30,9 +34,9 @@ class Alignment( enum.Enum ):
 
 
 def fetch_activities( url, token ):
-    r = requests.get( f'{url}/activity/', **request_kwargs( token ) )
+    r = client.get( f'{url}/activity/', token=token )
     verify_response( r )
-    return simple_changeset_to_list( r.json() )
+    return simple_changeset_to_list( response_json( r ) )
 
 
 def fetch_activity_data( url, token ):
@@ -45,7 +49,7 @@ def filter_activity_data_by_subject( data, subject_id ):
 
 
 def delete_activity_data( url, token, activity_id ):
-    r = requests.delete( f'{url}/activity/{activity_id}', **request_kwargs( token ) )
+    r = client.delete( f'{url}/activity/{activity_id}', token=token )
     verify_response( r )
 
 
@@ -92,9 +96,9 @@ def align_date( date: datetime.datetime, alignment: Alignment ):
         return date
 
 
-def calc_daily_summarized_times( data, subject_ids, alignment: Alignment ):
+def calc_daily_summarized_times( activities, subject_ids, alignment: Alignment ):
     aligned_start_to_milliseconds = {}
-    for activity in data['activities']:
+    for activity in activities:
         if activity['subject_id'] in subject_ids:
             if activity['end'] == '':
                 activity_id = activity['id']
@@ -114,8 +118,39 @@ def calc_daily_summarized_times( data, subject_ids, alignment: Alignment ):
     } for day, milliseconds in aligned_start_to_milliseconds.items()]
 
 
+def summarize_export( reader: ExportReader, source_subject, alignment: Alignment ):
+    # Exports list the subjects before the activities, which then get summarized while parsing them.
+    data = {}
+    for key, entities in reader.collections():
+        if key == 'activities' and 'subjects' in data:
+            return calc_daily_summarized_times( entities, summarized_subject_ids( data, source_subject ), alignment )
+        if key in ('subjects', 'activities'):
+            data[key] = list( entities )
+    return calc_daily_summarized_times( data['activities'], summarized_subject_ids( data, source_subject ), alignment )
+
+
+def summarize_indexed_export( filename, source_subject, alignment: Alignment ):
+    # only reads the subjects and the activities of the summarized subjects
+    if not is_index_current( filename ):
+        print( f'Indexing {filename}...' )
+        try:
+            build_index( filename )
+        except ValueError as e:
+            print_err( f'FATAL: {e}' )
+            sys.exit( 1 )
+    with ExportIndex( filename ) as index:
+        subject_ids = summarized_subject_ids( {'subjects': list( index.entities( 'subjects' ) )}, source_subject )
+        return calc_daily_summarized_times( index.entities( 'activities', subject_ids ), subject_ids, alignment )
+
+
+def summarized_subject_ids( data, source_subject ):
+    subject_ids = get_subject_descendants( data, source_subject )
+    subject_ids.add( source_subject )
+    return subject_ids
+
+
 def import_activity( url, token, data ):
-    r = requests.post( f'{url}/activity/', json=data, **request_kwargs( token ) )
+    r = client.post( f'{url}/activity/', json=data, token=token )
     verify_response( r, data )
 
 
@@ -132,7 +167,9 @@ def main():
     add_default_arguments( parser, with_y=True )
     parser.add_argument( '-s', type=Alignment, choices=list( Alignment ), help='How to summarize, default: %(default)s',
                          default=Alignment.daily )
-    parser.add_argument( 'input', metavar='INPUT', type=str, help='source json file' )
+    parser.add_argument( '--index', action='store_true',
+                         help='use the index INPUT.idx (built if missing or outdated) to only read the needed activities' )
+    parser.add_argument( 'input', metavar='INPUT', type=str, help='source json file (may be compressed)' )
     parser.add_argument( 'source_subject', metavar='SOURCE_SUBJECT', type=int, help='source subject id' )
     parser.add_argument( 'target_subject', metavar='TARGET_SUBJECT', type=int, help='target subject id' )
     parser.add_argument( 'target_location', metavar='TARGET_LOCATION', type=int, help='target location id' )
@@ -143,10 +180,11 @@ def main():
     access_token, refresh_token, user_id = login( args.api, args.e, args.u, args.p )
     try:
         delete_subject_activities( args.api, access_token, args.target_subject, args.y )
-        data = load_data( args.input )
-        subject_ids = get_subject_descendants( data['data'], args.source_subject )
-        subject_ids.add( args.source_subject )
-        times = calc_daily_summarized_times( data['data'], subject_ids, args.s )
+        if args.index:
+            times = summarize_indexed_export( args.input, args.source_subject, args.s )
+        else:
+            with ExportReader( args.input ) as reader:
+                times = summarize_export( reader, args.source_subject, args.s )
         import_activities( args.api, access_token, [{
             **time,
             'subject_id': args.target_subject,
@@ -1,80 +1,111 @@
 #!/usr/bin/env python3
 
 import argparse
-import csv
+import collections
+import functools
+import os
 import sys
 
 import progress.bar
-import requests
 
-from shared.common.auth import request_kwargs
+from shared.common.client import client
+from shared.common.parallel import run_parallel
 from v0.common.auth import login
 from v0.common.auth import logout
+from shared.common.utils import print_err
 from shared.common.utils import verify_response
 from v0.common.clear import clear_data
 from v0.common.parser import add_default_arguments
 from v0.common.parser import verify_default_arguments
-
-
-def import_csv( url, token, reader, on_row_complete, dry_run ):
-    def normalized_date( csv_date ):
-        date = csv_date.replace( ' ', 'T' )
-        if len( date ) == 19:
-            date += '.000Z'
-        elif len( date ) == 23:
-            date += 'Z'
-        return date
-
-    for row in reader:
-        data = {
-            'start': normalized_date( row[0] ),
-            'end': normalized_date( row[1] ),
-            'subject_parent_name': row[3],
-            'subject_name': row[4],
-            'location_name': row[2],
-            **({'data': {"comment": row[5]}} if len( row ) > 5 and row[5] != '' else {})
-        }
-        if not dry_run:
-            r = requests.post( f'{url}/activity/', json=data, **request_kwargs( token ) )
-            verify_response( r, data )
-        on_row_complete()
-
-
-def import_files( url, token, filenames, dry_run ):
-    for filename in filenames:
-        with open( filename ) as csvfile:
-            reader = csv.reader( csvfile, delimiter='\t', quotechar='"' )
-
-            row_count = sum( 1 for _ in reader )
-            csvfile.seek( 0 )
-
-            bar = progress.bar.Bar( f'Uploading {filename}...', max=row_count )
-            import_csv( url, token, reader, lambda: bar.next(), dry_run )
-            bar.finish()
+from v0.common.tsv import count_lines
+from v0.common.tsv import find_overlaps
+from v0.common.tsv import read_activities
+from v0.common.tsv import split_file
+from v0.common.tsv import validate_chunk
+
+
+def import_files( url, token, filenames, jobs=1 ):
+    # the rows of all files share one bounded pool of uploads
+    def import_activity( data ):
+        r = client.post( f'{url}/activity/', json=data, token=token )
+        verify_response( r, data )
+
+    bar = progress.bar.Bar( f'Uploading...', max=sum( count_lines( filename ) for filename in filenames ) )
+    run_parallel( import_activity, read_activities( filenames ), jobs, lambda _: bar.next() )
+    bar.finish()
+
+
+def validate_files( filenames, known_locations, processes ):
+    # Checks all rows in chunks spread over `processes` worker processes, returns (rows, problems) with the
+    # problems as (filename, line, message), ordered like the input.
+    rows = 0
+    problems = []
+    intervals = []
+    # sizes of the submitted chunks, the results arrive in the same order
+    sizes = collections.deque()
+
+    def chunks():
+        for filename in filenames:
+            for chunk in split_file( filename ):
+                sizes.append( len( chunk[2] ) )
+                yield chunk
+
+    def on_validated( result ):
+        nonlocal rows
+        chunk_rows, chunk_problems, chunk_intervals = result
+        rows += chunk_rows
+        problems.extend( chunk_problems )
+        intervals.append( chunk_intervals )
+        bar.next( sizes.popleft() )
+
+    bar = progress.bar.Bar( f'Validating...', max=max( 1, sum( os.path.getsize( filename ) for filename in filenames ) ) )
+    run_parallel( functools.partial( validate_chunk, known_locations=known_locations ), chunks(), processes,
+                  on_validated, ordered=True, processes=True )
+    bar.finish()
+
+    order = {filename: index for index, filename in enumerate( filenames )}
+    problems += find_overlaps( intervals )
+    problems.sort( key=lambda problem: (order[problem[0]], problem[1]) )
+    return rows, problems
 
 
 def main():
     parser = argparse.ArgumentParser( description='(Re)import Beaverlog data from CSV.' )
-    add_default_arguments( parser, with_y=True )
+    add_default_arguments( parser, with_y=True, with_jobs=True )
     parser.add_argument( '--append', action='store_true', help='do not clear data before importing' )
-    parser.add_argument( '--dry-run', action='store_true', help='useful to check input files for errors' )
+    parser.add_argument( '--dry-run', action='store_true',
+                         help='only check the input files for errors (without connecting to the server)' )
+    parser.add_argument( '--location', metavar='NAME', type=str, action='append',
+                         help='with --dry-run: known location name (repeatable), rows with other locations are errors' )
+    parser.add_argument( '--processes', metavar='N', type=int, help='with --dry-run: worker processes, '
+                                                                     'default: number of CPUs' )
     parser.add_argument( 'input', metavar='INPUT', type=str, nargs='+', help='one or more tsv files' )
 
     args = parser.parse_args()
     verify_default_arguments( args )
 
-    if not args.dry_run:
-        access_token, refresh_token, _ = login( args.api, args.e, args.u, args.p )
-    else:
-        access_token = 'dummy'
-        refresh_token = 'dummy'
+    if args.dry_run:
+        processes = args.processes if args.processes is not None else os.cpu_count() or 1
+        if processes < 1:
+            print_err( '--processes must be at least 1.' )
+            sys.exit( 1 )
+        known_locations = frozenset( args.location ) if args.location is not None else None
+        rows, problems = validate_files( args.input, known_locations, processes )
+        for filename, line, message in problems:
+            print_err( f'{filename}:{line}: {message}' )
+        if len( problems ) > 0:
+            print_err( f'FATAL: Found {len( problems )} problems in {rows} rows.' )
+            sys.exit( 1 )
+        print( f'All {rows} rows are valid.' )
+        return
+
+    access_token, refresh_token, _ = login( args.api, args.e, args.u, args.p )
     try:
-        if not args.dry_run and not args.append:
+        if not args.append:
             clear_data( args.api, access_token, args.y )
-        import_files( args.api, access_token, args.input, args.dry_run )
+        import_files( args.api, access_token, args.input, args.jobs )
     finally:
-        if not args.dry_run:
-            logout( args.api, access_token, refresh_token )
+        logout( args.api, access_token, refresh_token )
 
     print( 'Import successful.' )
 
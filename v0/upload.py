@@ -5,9 +5,13 @@ import json
 import sys
 
 import progress.bar
-import requests
+import progress.counter
 
-from shared.common.auth import request_kwargs
+from shared.common.client import client
+from shared.common.codec import response_json
+from shared.common.export import ExportReader
+from shared.common.graph import dependency_levels
+from shared.common.parallel import run_parallel
 from v0.common.auth import login
 from v0.common.auth import logout
 from shared.common.utils import pretty_json
@@ -15,7 +19,6 @@ from shared.common.utils import print_err
 from shared.common.utils import simple_changeset_to_list
 from shared.common.utils import verify_response
 from v0.common.clear import clear_data
-from v0.common.data import load_data
 from v0.common.parser import add_default_arguments
 from v0.common.parser import verify_default_arguments
 
@@ -27,15 +30,15 @@ def import_subject( url, token, subject, new_id_map ):
         'is_project': subject['is_project'],
         'parent_ids': [new_id_map[parent_id] for parent_id in subject['parent_ids']],
     }
-    r = requests.post( f'{url}/subject/', json=data, **request_kwargs( token ) )
+    r = client.post( f'{url}/subject/', json=data, token=token )
     verify_response( r, data )
-    changes = simple_changeset_to_list( r.json() )
+    changes = simple_changeset_to_list( response_json( r ) )
     assert len( changes ) == 1
     return changes[0]['id']
 
 
 def check_subject_id_exists_on_server( url, token, subject_id ):
-    r = requests.get( f'{url}/subject/{subject_id}', **request_kwargs( token ) )
+    r = client.get( f'{url}/subject/{subject_id}', token=token )
     if not (200 <= r.status_code < 300):
         return False
     return True
@@ -57,7 +60,7 @@ def verify_subject_ids_exist_on_server( url, token, subjects ):
         sys.exit( 1 )
 
 
-def import_subjects( url, token, subjects, subject_name_whitelist, subject_name_blacklist ):
+def import_subjects( url, token, subjects, subject_name_whitelist, subject_name_blacklist, jobs=1 ):
     private_subjects = [subject for subject in subjects if subject['organization_id'] == 0]
     organization_subjects_map = {subject['id']: subject for subject in subjects if subject['organization_id'] != 0}
     used_organization_subject_ids = set()
@@ -69,7 +72,6 @@ def import_subjects( url, token, subjects, subject_name_whitelist, subject_name_
     verify_subject_ids_exist_on_server( url, token, used_organization_subjects )
     organization_subject_ids = set( [item['id'] for item in used_organization_subjects] )
     new_id_map = {item['id']: item['id'] for item in used_organization_subjects}
-    processed_ids = set()
     pending = {item['id']: item
                for item
                in private_subjects
@@ -78,22 +80,32 @@ def import_subjects( url, token, subjects, subject_name_whitelist, subject_name_
                        (not item['name'] in subject_name_blacklist)
                )
                }
+    private_parent_ids = {
+        key: [id_ for id_ in subject['parent_ids'] if id_ not in organization_subject_ids]
+        for key, subject in pending.items()
+    }
+    dangling = [pending[key] for key, parent_ids in private_parent_ids.items()
+                if any( parent_id not in pending for parent_id in parent_ids )]
+    if len( dangling ) > 0:
+        print_err( f'FATAL: The following subjects have dangling parents:\n{pretty_json( dangling )}' )
+        sys.exit( 1 )
+    levels, cyclic = dependency_levels( private_parent_ids )
+    if len( cyclic ) > 0:
+        cyclic_subjects = [pending[key] for key in cyclic]
+        print_err( f'FATAL: The following subjects have cyclic parents:\n{pretty_json( cyclic_subjects )}' )
+        sys.exit( 1 )
+
+    def on_complete( ids ):
+        new_id_map[ids[0]] = ids[1]
+        bar.next()
+
+    # all subjects of a level only depend on subjects of previous levels
     bar = progress.bar.Bar( f'Uploading...', max=len( private_subjects ) )
-    while len( pending ) > 0:
-        delete = []
-        for key, subject in pending.items():
-            private_parent_ids = list(
-                filter( lambda id_: id_ not in organization_subject_ids, subject['parent_ids'] ) )
-            if len( private_parent_ids ) == 0 or all( parent_id in processed_ids for parent_id in private_parent_ids ):
-                processed_ids.add( subject['id'] )
-                new_id_map[subject['id']] = import_subject( url, token, subject, new_id_map )
-                bar.next()
-                delete.append( key )
-        for key in delete:
-            del pending[key]
-        if len( delete ) == 0:
-            print_err( f'\nFATAL: The following subjects have dangling parents:\n{pretty_json( pending )}' )
-            sys.exit( 1 )
+    for level in levels:
+        run_parallel( lambda key: (key, import_subject( url, token, pending[key], new_id_map )),
+                      level,
+                      jobs,
+                      on_complete )
     bar.finish()
     return new_id_map
 
@@ -103,19 +115,25 @@ def import_location( url, token, location ):
         'name': location['name'],
         'coordinates': location['coordinates'],
     }
-    r = requests.post( f'{url}/location/', json=data, **request_kwargs( token ) )
+    r = client.post( f'{url}/location/', json=data, token=token )
     verify_response( r, data )
-    changes = simple_changeset_to_list( r.json() )
+    changes = simple_changeset_to_list( response_json( r ) )
     assert len( changes ) == 1
     return changes[0]['id']
 
 
-def import_locations( url, token, locations ):
+def import_locations( url, token, locations, jobs=1 ):
     new_id_map = {}
-    bar = progress.bar.Bar( f'Uploading...', max=len( locations ) )
-    for location in locations:
-        new_id_map[location['id']] = import_location( url, token, location )
+
+    def on_complete( ids ):
+        new_id_map[ids[0]] = ids[1]
         bar.next()
+
+    bar = progress.bar.Bar( f'Uploading...', max=len( locations ) )
+    run_parallel( lambda location: (location['id'], import_location( url, token, location )),
+                  locations,
+                  jobs,
+                  on_complete )
     bar.finish()
     return new_id_map
 
@@ -128,27 +146,61 @@ def import_activity( url, token, activity, new_subject_id_map, new_location_id_m
         'end': activity['end'],
         'data': activity['data'],
     }
-    r = requests.post( f'{url}/activity/', json=data, **request_kwargs( token ) )
+    r = client.post( f'{url}/activity/', json=data, token=token )
     verify_response( r, data )
 
 
-def import_activities( url, token, activities, new_subject_id_map, new_location_id_map ):
-    bar = progress.bar.Bar( f'Uploading...', max=len( activities ) )
-    for activity in activities:
-        import_activity( url, token, activity, new_subject_id_map, new_location_id_map )
-        bar.next()
+def import_activities( url, token, activities, new_subject_id_map, new_location_id_map, jobs=1 ):
+    # `activities` may be a generator, the progress then only counts them
+    if isinstance( activities, list ):
+        bar = progress.bar.Bar( f'Uploading...', max=len( activities ) )
+    else:
+        bar = progress.counter.Counter( f'Uploading... ' )
+    run_parallel( lambda activity: import_activity( url, token, activity, new_subject_id_map, new_location_id_map ),
+                  activities,
+                  jobs,
+                  lambda _: bar.next() )
     bar.finish()
 
 
-def import_json( url, token, data, subject_name_whitelist, subject_name_blacklist ):
+def import_subjects_and_locations( url, token, data, subject_name_whitelist, subject_name_blacklist, jobs=1 ):
     print( 'Importing subject data...' )
-    new_subject_id_map = import_subjects( url, token, data['subjects'], subject_name_whitelist, subject_name_blacklist )
+    new_subject_id_map = import_subjects( url, token, data['subjects'], subject_name_whitelist, subject_name_blacklist,
+                                          jobs )
     print( 'Importing location data...' )
-    new_location_id_map = import_locations( url, token, data['locations'] )
+    new_location_id_map = import_locations( url, token, data['locations'], jobs )
+    return new_subject_id_map, new_location_id_map
+
+
+def import_json( url, token, data, subject_name_whitelist, subject_name_blacklist, jobs=1 ):
+    new_subject_id_map, new_location_id_map = import_subjects_and_locations( url, token, data, subject_name_whitelist,
+                                                                             subject_name_blacklist, jobs )
     print( 'Importing activity data...' )
     import_activities( url, token,
                        [activity for activity in data['activities'] if activity['subject_id'] in new_subject_id_map],
-                       new_subject_id_map, new_location_id_map )
+                       new_subject_id_map, new_location_id_map, jobs )
+
+
+def import_export( url, token, reader: ExportReader, parent_id_map, subject_name_whitelist, subject_name_blacklist,
+                   jobs=1 ):
+    # Exports list the subjects and locations before the activities, which then get uploaded while parsing them
+    # instead of loading all of them first.
+    data = {}
+    for key, entities in reader.collections():
+        if key == 'activities' and 'subjects' in data and 'locations' in data:
+            new_subject_id_map, new_location_id_map = import_subjects_and_locations( url, token, data,
+                                                                                     subject_name_whitelist,
+                                                                                     subject_name_blacklist, jobs )
+            print( 'Importing activity data...' )
+            import_activities( url, token,
+                               (activity for activity in entities if activity['subject_id'] in new_subject_id_map),
+                               new_subject_id_map, new_location_id_map, jobs )
+            return
+        if key in ('subjects', 'locations', 'activities'):
+            data[key] = list( entities )
+            if key == 'subjects' and len( parent_id_map ) > 0:
+                map_parent_ids( data['subjects'], parent_id_map )
+    import_json( url, token, data, subject_name_whitelist, subject_name_blacklist, jobs )
 
 
 def map_parent_ids( subjects, parent_id_map ):
@@ -163,11 +215,11 @@ def map_parent_ids( subjects, parent_id_map ):
 
 def main():
     parser = argparse.ArgumentParser( description='(Re)import Beaverlog data.' )
-    add_default_arguments( parser, with_y=True )
+    add_default_arguments( parser, with_y=True, with_jobs=True )
     parser.add_argument( '--parent-id-map', metavar='JSON', type=str, help='map for organization parent ids' )
     parser.add_argument( '--whitelist', metavar='JSON', type=str, help='array with subject names to allow' )
     parser.add_argument( '--blacklist', metavar='JSON', type=str, help='array with subject names to ignore' )
-    parser.add_argument( 'input', metavar='INPUT', type=str, help='source json file' )
+    parser.add_argument( 'input', metavar='INPUT', type=str, help='source json file (may be compressed)' )
 
     args = parser.parse_args()
     verify_default_arguments( args )
@@ -191,10 +243,9 @@ def main():
     access_token, refresh_token, _ = login( args.api, args.e, args.u, args.p )
     try:
         clear_data( args.api, access_token, args.y )
-        data = load_data( args.input )
-        if len( parent_id_map ) > 0:
-            map_parent_ids( data['data']['subjects'], parent_id_map )
-        import_json( args.api, access_token, data['data'], subject_name_whitelist, subject_name_blacklist )
+        with ExportReader( args.input ) as reader:
+            import_export( args.api, access_token, reader, parent_id_map, subject_name_whitelist,
+                           subject_name_blacklist, args.jobs )
     finally:
         logout( args.api, access_token, refresh_token )
 
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import sys
+import time
+
+from shared.common.codec import BACKEND
+from shared.common.codec import dumps_pretty
+from shared.common.codec import loads
+from shared.common.compression import CompressedFile
+from shared.common.export import ExportReader
+from shared.common.utils import print_err
+
+
+def best_of( repeat, function ):
+    # seconds of the fastest run
+    best = None
+    for _ in range( repeat ):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min( best, elapsed )
+    return best
+
+
+def read_streaming( filename ):
+    with ExportReader( filename ) as reader:
+        for _, entities in reader.collections():
+            for _ in entities:
+                pass
+
+
+def read_loaded( filename ):
+    with ExportReader( filename ) as reader:
+        reader.load()
+
+
+def main():
+    parser = argparse.ArgumentParser( description='Compare the JSON backends on a (large) Beaverlog json export.' )
+    parser.add_argument( '-n', metavar='REPEAT', type=int, default=3, help='runs per measurement, the fastest counts' )
+    parser.add_argument( 'input', metavar='INPUT', type=str, help='json export (may be compressed)' )
+
+    args = parser.parse_args()
+
+    file = CompressedFile( args.input )
+    try:
+        text = file.read()
+    finally:
+        file.close()
+    try:
+        data = json.loads( text )
+    except ValueError as e:
+        print_err( f'FATAL: {args.input} is no json file: {e}' )
+        sys.exit( 1 )
+    if loads( text ) != data:
+        print_err( f'FATAL: the {BACKEND} backend decodes {args.input} differently than the stdlib.' )
+        sys.exit( 1 )
+    if dumps_pretty( data ) != json.dumps( data, indent=4 ):
+        print_err( f'FATAL: the encoded output differs from the stdlib.' )
+        sys.exit( 1 )
+
+    entities = sum( len( entities ) for entities in data.get( 'data', {} ).values() )
+    print( f'{args.input}: {len( text ) / 1e6:.1f} MB, {entities} entities, backend: {BACKEND}' )
+
+    baseline = best_of( args.n, lambda: json.loads( text ) )
+    results = [
+        ('decode, json', baseline),
+        (f'decode, codec ({BACKEND})', best_of( args.n, lambda: loads( text ) )),
+        ('ExportReader, streaming', best_of( args.n, lambda: read_streaming( args.input ) )),
+        ('ExportReader.load', best_of( args.n, lambda: read_loaded( args.input ) )),
+    ]
+    for name, seconds in results:
+        print( f'{name:<32}{seconds:8.3f} s  {baseline / seconds:5.2f}x' )
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit( main() )
+    except KeyboardInterrupt:
+        sys.exit( 1 )
@@ -0,0 +1,72 @@
+import contextlib
+import glob
+import io
+import os
+import time
+
+from shared.common.compression import COMPRESSIONS
+from v1.common.data import load_data
+from v1.common.data import save_data
+
+# files picked up from directories (optionally compressed)
+EXPORT_EXTENSIONS = ('.json', '.ndjson', '.jsonl', '.sqlite', '.sqlite3', '.db')
+EXPORT_SUFFIXES = EXPORT_EXTENSIONS + tuple(
+    extension + compression_extension for extension in EXPORT_EXTENSIONS
+    for compression_extension, _, _ in COMPRESSIONS.values() )
+
+
+def expand_inputs( patterns, output_dir ):
+    # Returns [(input, output)] for files, directories (searched recursively for exports) and glob patterns.
+    # Files of a directory keep their path relative to it below `output_dir`, all others only their name.
+    # Raises ValueError for patterns without any file and for inputs which would share an output.
+    output_root = os.path.abspath( output_dir ) + os.sep
+    tasks = {}
+    for pattern in patterns:
+        if os.path.isdir( pattern ):
+            found = [(path, os.path.relpath( path, pattern ))
+                     for path in glob.glob( os.path.join( glob.escape( pattern ), '**', '*' ), recursive=True )
+                     if path.endswith( EXPORT_SUFFIXES ) and os.path.isfile( path )]
+        elif glob.has_magic( pattern ):
+            found = [(path, os.path.basename( path ))
+                     for path in glob.glob( pattern, recursive=True ) if os.path.isfile( path )]
+        elif os.path.isfile( pattern ):
+            found = [(pattern, os.path.basename( pattern ))]
+        else:
+            found = []
+        if len( found ) == 0:
+            raise ValueError( f'{pattern} matches no files' )
+        for path, relative in found:
+            # earlier outputs in an input directory
+            if os.path.abspath( path ).startswith( output_root ):
+                continue
+            output = os.path.join( output_dir, relative )
+            if output in tasks and os.path.abspath( tasks[output] ) != os.path.abspath( path ):
+                raise ValueError( f'{tasks[output]} and {path} would both be upgraded to {output}' )
+            tasks[output] = path
+    return sorted( (path, output) for output, path in tasks.items() )
+
+
+def is_up_to_date( input_filename, output_filename ):
+    return os.path.exists( output_filename ) and os.path.getmtime( output_filename ) >= os.path.getmtime(
+        input_filename )
+
+
+def upgrade_file( task ):
+    # Runs in a worker process, returns (input, output, seconds, error, messages) with error None on success.
+    # Messages of the upgrade (e.g. the added subjects) get captured, the last one explains a failure.
+    input_filename, output_filename = task
+    start = time.perf_counter()
+    messages = io.StringIO()
+    error = None
+    try:
+        with contextlib.redirect_stdout( messages ), contextlib.redirect_stderr( messages ):
+            data = load_data( input_filename, True )
+            os.makedirs( os.path.dirname( output_filename ) or '.', exist_ok=True )
+            save_data( data, output_filename, True )
+    except SystemExit:
+        lines = messages.getvalue().strip().split( '\n' )
+        error = lines[-1] if lines[-1] != '' else 'failed'
+    except Exception as e:
+        error = f'{type( e ).__name__}: {e}'
+    lines = [line for line in messages.getvalue().split( '\n' ) if line.strip() != '']
+    return input_filename, output_filename, time.perf_counter() - start, error, lines
@@ -1,6 +1,4 @@
-import requests
-
-from shared.common.auth import request_kwargs
+from shared.common.client import client
 from shared.common.utils import verify_response
 from v1.common.remote import RemoteData
 
@@ -11,5 +9,5 @@ def clear_data( remote_data: RemoteData, skip_warning ):
         print( f'         on {remote_data.url}' )
         input( 'Press Enter to continue' )
     print( 'Removing data...' )
-    r = requests.delete( f'{remote_data.url}/batch/all-private', **request_kwargs( remote_data.access_token ) )
+    r = client.delete( f'{remote_data.url}/batch/all-private', token=remote_data.access_token )
     verify_response( r )
@@ -1,20 +1,25 @@
-import json
 import os
 import sys
 
+from shared.common.export import open_export_reader
+from shared.common.export import open_export_writer
 from shared.common.utils import print_err
+from v1.common.upgrade_cache import UpgradeCache
 from v1.detail.upgrade.v0 import upgrade_from_v0
 
 
-def _upgrade_data( data, error_on_noop ):
+def _upgrade_data( data, error_on_noop, allow_v1, processes=1 ):
     if not 'api_version' in data:
         print( 'Upgrading data from v0 to v1...' )
-        return upgrade_from_v0( data )
+        # nothing else refers to the loaded data
+        return upgrade_from_v0( data, in_place=True, processes=processes )
     version = data['api_version']
     if version == 1:
         if error_on_noop:
             print_err( 'Only data exported by v0 can be converted to v1.' )
             sys.exit( 1 )
+        if allow_v1:
+            return data
         # TODO: complete upload script
         print_err( 'Attention: v1 data cannot be processed yet, only downloaded.' )
         sys.exit( 1 )
@@ -25,9 +30,38 @@ def _upgrade_data( data, error_on_noop ):
 
 
 
-def load_data( filename, error_on_noop=False ):
-    with open( filename ) as jsonfile:
-        return _upgrade_data( json.load( jsonfile ), error_on_noop )
+def load_data_and_version( filename, error_on_noop=False, allow_v1=False, processes=1, cache: UpgradeCache = None ):
+    # Returns the (upgraded) data and the api version of the file.
+    # `cache` skips upgrading a v0 file which got upgraded before.
+    if cache is not None:
+        key = cache.key( filename )
+        data = cache.load( key )
+        if data is not None:
+            print( 'Using the cached upgrade from v0 to v1...' )
+            return data, 0
+    with open_export_reader( filename ) as reader:
+        data = reader.load()
+    version = data.get( 'api_version', 0 )
+    upgraded = _upgrade_data( data, error_on_noop, allow_v1, processes )
+    # v1 data (returned as it is) does not need to be cached
+    if cache is not None and upgraded is not data:
+        cache.store( key, upgraded )
+    return upgraded, version
+
+
+def load_data( filename, error_on_noop=False, allow_v1=False, processes=1, cache: UpgradeCache = None ):
+    data, _ = load_data_and_version( filename, error_on_noop, allow_v1, processes, cache )
+    return data
+
+
+def load_export( filename ):
+    # loads a v1 export as it is (without any upgrade)
+    with open_export_reader( filename ) as reader:
+        data = reader.load()
+    if data.get( 'api_version' ) != 1:
+        print_err( f'{filename} is not a v1 export.' )
+        sys.exit( 1 )
+    return data
 
 
 def save_data( data, filename, skip_warning ):
@@ -35,4 +69,6 @@ def save_data( data, filename, skip_warning ):
         print( f'WARNING: {filename} already exists' )
         print( f'         and will get overridden' )
         input( 'Press Enter to continue' )
-    json.dump( data, open( filename, 'w' ), indent=4, sort_keys=False )
+    with open_export_writer( filename, {key: value for key, value in data.items() if key != 'data'} ) as writer:
+        for key, entities in data['data'].items():
+            writer.write_collection( key, entities )
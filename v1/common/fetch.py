@@ -0,0 +1,95 @@
+import datetime
+import email.utils
+
+import progress.bar
+import requests
+
+from shared.common.client import client
+from shared.common.codec import response_json
+from shared.common.parallel import run_parallel
+from shared.common.utils import date_to_string
+from shared.common.utils import merge_changeset
+from shared.common.utils import simple_changeset_to_list
+from shared.common.utils import verify_response
+from v1.common.remote import RemoteData
+
+
+COLLECTION_ENDPOINTS = {
+    'users': 'user',
+    'subjects': 'subject',
+    'locations': 'location',
+    'activities': 'activity',
+    'organizations': 'organization',
+    'tracker_links': 'tracker-link',
+    'tracker_projects': 'tracker-project',
+    'tracker_issues': 'tracker-issue',
+    'reports': 'report',
+}
+
+
+def fetch_changeset( remote_data: RemoteData, endpoint, since=None ):
+    r = client.get( f'{remote_data.url}/{endpoint}/', token=remote_data.access_token,
+                    params={'since': since} if since is not None else None )
+    verify_response( r )
+    return response_json( r )
+
+
+def fetch_changesets( remote_data: RemoteData, on_fetched, jobs=1, since=None ):
+    # calls `on_fetched( key, changeset )` for every collection in the order of COLLECTION_ENDPOINTS
+    def on_complete( item ):
+        bar.next()
+        on_fetched( *item )
+
+    bar = progress.bar.Bar( f'Downloading...', max=len( COLLECTION_ENDPOINTS ) )
+    run_parallel( lambda key: (key, fetch_changeset( remote_data, COLLECTION_ENDPOINTS[key], since )),
+                  list( COLLECTION_ENDPOINTS.keys() ),
+                  jobs,
+                  on_complete,
+                  ordered=True )
+    bar.finish()
+
+
+def stream_data( remote_data: RemoteData, on_fetched, jobs=1 ):
+    # calls `on_fetched( key, entities )` for every collection as soon as it (and all previous ones) arrived
+    fetch_changesets( remote_data,
+                      lambda key, changeset: on_fetched( key, simple_changeset_to_list( changeset ) ),
+                      jobs )
+
+
+def fetch_server_time( remote_data: RemoteData ):
+    # the time of the server from the Date header of a HEAD request (any status), None if it is not available
+    try:
+        r = client.request( 'HEAD', f'{remote_data.url}/' )
+        date = email.utils.parsedate_to_datetime( r.headers['Date'] )
+    except (requests.exceptions.RequestException, KeyError, TypeError, ValueError):
+        return None
+    return date_to_string( date.astimezone( datetime.timezone.utc ).replace( tzinfo=None ) )
+
+
+def is_delta( changeset ):
+    # ASSUMPTION, not checked against the server yet: a server which applied `since` echoes it in the response,
+    # all other responses contain the complete collection (and replace the previous one).
+    # If the server reports deltas differently, adjust this and shared.common.utils.is_deletion.
+    return 'since' in changeset
+
+
+def stream_merged_data( remote_data: RemoteData, previous_data, since, on_fetched, jobs=1 ):
+    # only fetches what changed since the previous export and applies it to the previous data,
+    # complete collections replace the previous ones (they do not mark deletions)
+    def on_changeset( key, changeset ):
+        if is_delta( changeset ):
+            on_fetched( key, merge_changeset( previous_data['data'].get( key, [] ), changeset ) )
+        else:
+            on_fetched( key, simple_changeset_to_list( changeset ) )
+
+    fetch_changesets( remote_data, on_changeset, jobs, since )
+
+
+def fetch_data( remote_data: RemoteData, jobs=1 ):
+    data = {}
+
+    def on_fetched( key, entities ):
+        data[key] = entities
+
+    stream_data( remote_data, on_fetched, jobs )
+    return data
@@ -1,9 +1,9 @@
 import uuid
 
-import requests
 from hashids import Hashids
 
-from shared.common.auth import request_kwargs
+from shared.common.client import client
+from shared.common.codec import response_json
 from shared.common.utils import verify_response
 
 EMPTY_ID = '0'
@@ -41,7 +41,7 @@ def next_id( id_ ):
 
 def get_id_data( url, access_token ):
     print( 'Fetching ID data...' )
-    r = requests.post( f'{url}/id/', **request_kwargs( access_token ) )
+    r = client.post( f'{url}/id/', token=access_token )
     verify_response( r )
-    payload = r.json()
+    payload = response_json( r )
     return payload['id_offset'], payload['id_token']
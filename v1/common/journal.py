@@ -0,0 +1,115 @@
+import os
+import sys
+import threading
+
+from shared.common.codec import dumps
+from shared.common.codec import loads
+from shared.common.utils import print_err
+from v1.common.remote import IdManager
+
+JOURNAL_VERSION = 1
+
+
+class UploadJournal:
+    # Append-only JSON lines file recording the progress of an upload:
+    #     {"version": 1, "input": ..., "id_token": ..., "prev_id": ...}  header with the id token state
+    #     {"new": [entity, eid, id]}                                     id generated by the IdManager
+    #     {"map": [entity, eid, id]}                                     id given by the user (--parent-id-map)
+    #     {"sent": [endpoint, [id, ...]]}                                request about to be sent
+    #     {"done": [endpoint, [id, ...]]}                                request confirmed by the server
+    # A crash may leave a truncated last line, which is ignored when loading.
+    # "sent" and "done" records get synced. An fsync also syncs the earlier lines, so every id of a request that may
+    # have reached the server is on disk. Lost "new"/"map" records only concern ids which were never sent.
+
+    def __init__( self, filename, file, input_filename ):
+        self.filename = filename
+        self.file = file
+        self.input_filename = input_filename
+        self.sent = {}
+        self.done = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def create( cls, filename, input_filename, id_manager: IdManager ):
+        journal = cls( filename, open( filename, 'w' ), input_filename )
+        journal._write( {
+            'version': JOURNAL_VERSION,
+            'input': input_filename,
+            'id_token': id_manager.id_token,
+            'prev_id': id_manager.prev_id,
+        }, True )
+        journal.attach( id_manager )
+        return journal
+
+    @classmethod
+    def load( cls, filename ):
+        # returns the journal (opened for appending) and the restored IdManager
+        with open( filename ) as f:
+            lines = f.read().split( '\n' )
+        records = []
+        for i, line in enumerate( lines ):
+            if line == '':
+                continue
+            try:
+                records.append( loads( line ) )
+            except ValueError:
+                if i < len( lines ) - 1 and any( rest != '' for rest in lines[i + 1:] ):
+                    print_err( f'FATAL: {filename}:{i + 1} is corrupt.' )
+                    sys.exit( 1 )
+        if len( records ) == 0 or records[0].get( 'version' ) != JOURNAL_VERSION:
+            print_err( f'FATAL: {filename} is not an upload journal.' )
+            sys.exit( 1 )
+
+        header = records[0]
+        prev_id = header['prev_id']
+        entity_id_map = {}
+        journal = cls( filename, None, header['input'] )
+        for record in records[1:]:
+            if 'new' in record or 'map' in record:
+                entity, eid, new_id = record['new'] if 'new' in record else record['map']
+                entity_id_map.setdefault( entity, {} )[eid] = new_id
+                if 'new' in record:
+                    prev_id = new_id
+            elif 'sent' in record:
+                endpoint, ids = record['sent']
+                journal.sent.setdefault( endpoint, set() ).update( ids )
+            elif 'done' in record:
+                endpoint, ids = record['done']
+                journal.done.setdefault( endpoint, set() ).update( ids )
+
+        # start on a fresh line in case the last one got truncated
+        journal.file = open( filename, 'a' )
+        journal.file.write( '\n' )
+        id_manager = IdManager.restore( header['id_token'], prev_id, entity_id_map )
+        journal.attach( id_manager )
+        return journal, id_manager
+
+    def attach( self, id_manager: IdManager ):
+        def on_map( entity, eid, new_id, generated ):
+            self._write( {('new' if generated else 'map'): [entity, eid, new_id]} )
+
+        id_manager.on_map = on_map
+
+    def is_done( self, endpoint, id_ ):
+        return id_ in self.done.get( endpoint, () )
+
+    def is_unconfirmed( self, endpoint, id_ ):
+        # sent in a previous run, but we do not know whether the server processed it
+        return id_ in self.sent.get( endpoint, () ) and not self.is_done( endpoint, id_ )
+
+    def record_sent( self, endpoint, ids ):
+        self._write( {'sent': [endpoint, ids]}, True )
+
+    def record_done( self, endpoint, ids ):
+        self.done.setdefault( endpoint, set() ).update( ids )
+        self._write( {'done': [endpoint, ids]}, True )
+
+    def close( self ):
+        self.file.close()
+
+    def _write( self, record, sync=False ):
+        with self.lock:
+            self.file.write( dumps( record ) + '\n' )
+            self.file.flush()
+            if sync:
+                os.fsync( self.file.fileno() )
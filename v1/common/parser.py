@@ -2,17 +2,36 @@
 
 import sys
 
+from shared.common.client import DEFAULT_POOL_SIZE
+from shared.common.client import DEFAULT_TIMEOUT
+from shared.common.client import client
+from shared.common.retry import DEFAULT_MAX_ATTEMPTS
 from shared.common.utils import print_err
+from v1.common.upgrade_cache import DEFAULT_MAX_SIZE
+from v1.common.upgrade_cache import UpgradeCache
+from v1.common.upgrade_cache import default_directory
 
 
-def add_default_arguments( parser, with_y=False ):
+def add_default_arguments( parser, with_y=False, with_jobs=False ):
     parser.add_argument( '--api', metavar='URL', type=str, help='default: %(default)s',
                          default='https://beaverlog.cc/api/v1' )
     parser.add_argument( '-e', metavar='EMAIL', type=str, help='email or username must be given' )
     parser.add_argument( '-u', metavar='USERNAME', type=str, help='email or username must be given' )
     parser.add_argument( '-p', metavar='PASSWORD', type=str, help='if not given you get prompted' )
+    parser.add_argument( '--timeout', metavar='SECONDS', type=float, help='request timeout, default: %(default)s',
+                         default=DEFAULT_TIMEOUT )
+    parser.add_argument( '--pool-size', metavar='N', type=int, help='kept-alive connections, default: %(default)s',
+                         default=DEFAULT_POOL_SIZE )
+    parser.add_argument( '--attempts', metavar='N', type=int,
+                         help='attempts for idempotent requests on transient failures, default: %(default)s',
+                         default=DEFAULT_MAX_ATTEMPTS )
     if with_y:
         parser.add_argument( '-y', action='store_true', help='skip warning notice' )
+    if with_jobs:
+        parser.add_argument( '--jobs', '-j', metavar='N', type=int, help='parallel requests, default: %(default)s',
+                             default=1 )
+        parser.add_argument( '--adaptive', action='store_true',
+                             help='adapt parallel requests (up to --jobs) to server latency and overload responses' )
 
 
 def verify_default_arguments( args ):
@@ -23,3 +42,35 @@ def verify_default_arguments( args ):
     if args.e is not None and args.u is not None:
         print_err( '-e and -u are mutually exclusive.' )
         sys.exit( 1 )
+
+    if args.pool_size < 1:
+        print_err( '--pool-size must be at least 1.' )
+        sys.exit( 1 )
+
+    if args.attempts < 1:
+        print_err( '--attempts must be at least 1.' )
+        sys.exit( 1 )
+
+    jobs = getattr( args, 'jobs', 1 )
+    if jobs < 1:
+        print_err( '--jobs must be at least 1.' )
+        sys.exit( 1 )
+
+    client.configure( max( args.pool_size, jobs ), args.timeout, getattr( args, 'adaptive', False ), args.attempts, jobs )
+
+
+def add_upgrade_cache_arguments( parser ):
+    parser.add_argument( '--upgrade-cache', metavar='DIR', type=str,
+                         help=f'where to keep upgraded v0 files, default: {default_directory()}' )
+    parser.add_argument( '--upgrade-cache-size', metavar='MB', type=int, default=DEFAULT_MAX_SIZE >> 20,
+                         help='upgraded files beyond this size get removed (least recently used first), '
+                              '0 disables the cache, default: %(default)s' )
+
+
+def upgrade_cache_of( args ):
+    if args.upgrade_cache_size < 0:
+        print_err( '--upgrade-cache-size must not be negative.' )
+        sys.exit( 1 )
+    if args.upgrade_cache_size == 0:
+        return None
+    return UpgradeCache( args.upgrade_cache, args.upgrade_cache_size << 20 )
@@ -12,6 +12,17 @@ class IdManager:
         id_offset, self.id_token = get_id_data( url, access_token )
         self.prev_id = _format_uuid_hashids_value( uuid.UUID( id_offset ) )
         self.entity_id_map = {}
+        # called as on_map( entity, eid, new_id, generated ) for every new mapping (used by the upload journal)
+        self.on_map = None
+
+    @classmethod
+    def restore( cls, id_token, prev_id, entity_id_map ):
+        id_manager = cls.__new__( cls )
+        id_manager.id_token = id_token
+        id_manager.prev_id = prev_id
+        id_manager.entity_id_map = entity_id_map
+        id_manager.on_map = None
+        return id_manager
 
     def mapped_id( self, entity: str, eid: str, assert_included: bool = False ) -> str:
         if not entity in self.entity_id_map:
@@ -21,6 +32,8 @@ class IdManager:
         if not eid in id_map:
             assert (not assert_included)
             id_map[eid] = self.prev_id = next_id( self.prev_id )
+            if self.on_map is not None:
+                self.on_map( entity, eid, id_map[eid], True )
         return id_map[eid]
 
     def has_id( self, entity: str, eid: str ) -> bool:
@@ -35,6 +48,8 @@ class IdManager:
         id_map = self.entity_id_map[entity]
         assert not eid in id_map
         id_map[eid] = new_id
+        if self.on_map is not None:
+            self.on_map( entity, eid, new_id, False )
 
 
 @dataclass
@@ -0,0 +1,126 @@
+import itertools
+import threading
+import typing
+
+from shared.common.client import client
+from shared.common.codec import response_json
+from shared.common.parallel import run_parallel
+from shared.common.retry import is_duplicate_create
+from shared.common.utils import simple_changeset_to_list
+from shared.common.utils import verify_response
+from v1.common.journal import UploadJournal
+from v1.common.remote import RemoteData
+
+# batches need a server with `/batch/<endpoint>/`, so they are opt-in
+DEFAULT_BATCH_SIZE = 1
+
+# status codes telling us that the server does not offer a batch endpoint for an entity type
+BATCH_UNSUPPORTED_STATUS_CODES = {404, 405, 501}
+
+
+def _chunks( iterable, size ):
+    iterator = iter( iterable )
+    while True:
+        chunk = list( itertools.islice( iterator, size ) )
+        if len( chunk ) == 0:
+            return
+        yield chunk
+
+
+class Transport:
+    def __init__( self, remote_data: RemoteData, jobs=1, batch_size=DEFAULT_BATCH_SIZE,
+                  journal: typing.Optional[UploadJournal] = None ):
+        self.remote_data = remote_data
+        self.jobs = jobs
+        self.batch_size = batch_size
+        self.journal = journal
+        self.batch_unsupported = set()
+        self.lock = threading.Lock()
+
+    def post( self, endpoint, data, single_change=True ):
+        r = client.post( f'{self.remote_data.url}/{endpoint}/', json=data, token=self.remote_data.access_token )
+        verify_response( r, data )
+        if single_change:
+            changes = simple_changeset_to_list( response_json( r ) )
+            assert len( changes ) == 1
+
+    def post_batch( self, endpoint, items, single_change=True ):
+        # Creates all `items` with one request to `/batch/<endpoint>/` and falls back to one request per item
+        # if the server does not support this.
+        if len( items ) > 1 and endpoint not in self.batch_unsupported:
+            r = client.post( f'{self.remote_data.url}/batch/{endpoint}/', json=items,
+                             token=self.remote_data.access_token )
+            if r.status_code in BATCH_UNSUPPORTED_STATUS_CODES:
+                with self.lock:
+                    self.batch_unsupported.add( endpoint )
+            elif is_duplicate_create( 'POST', items, r ):
+                # e.g. an earlier attempt of this batch got through, only create what is still missing
+                for data in items:
+                    if not self.exists( endpoint, data['id'] ):
+                        self.post( endpoint, data, single_change )
+                return items
+            else:
+                verify_response( r, items )
+                if single_change:
+                    changes = simple_changeset_to_list( response_json( r ) )
+                    assert len( changes ) == len( items )
+                return items
+        for data in items:
+            self.post( endpoint, data, single_change )
+        return items
+
+    def put( self, endpoint, data ):
+        r = client.put( f'{self.remote_data.url}/{endpoint}/{data["id"]}', json=data,
+                        token=self.remote_data.access_token )
+        verify_response( r, data )
+        return data
+
+    def delete( self, endpoint, id_ ):
+        r = client.delete( f'{self.remote_data.url}/{endpoint}/{id_}', token=self.remote_data.access_token )
+        verify_response( r )
+        return id_
+
+    def put_all( self, endpoint, items, on_complete=None ):
+        run_parallel( lambda data: self.put( endpoint, data ), items, self.jobs, on_complete )
+
+    def delete_all( self, endpoint, ids, on_complete=None ):
+        run_parallel( lambda id_: self.delete( endpoint, id_ ), ids, self.jobs, on_complete )
+
+    def exists( self, endpoint, id_ ):
+        r = client.get( f'{self.remote_data.url}/{endpoint}/{id_}', token=self.remote_data.access_token )
+        return 200 <= r.status_code < 300
+
+    def post_all( self, endpoint, items, on_complete=None, single_change=True ):
+        # `items` may be a generator, it is consumed in the calling thread.
+        # `on_complete` gets called with lists of items which are done (or already were according to the journal).
+        def post( chunk ):
+            if self.journal is not None:
+                self.journal.record_sent( endpoint, [item['id'] for item in chunk] )
+            return self.post_batch( endpoint, chunk, single_change )
+
+        def complete( chunk ):
+            if self.journal is not None:
+                self.journal.record_done( endpoint, [item['id'] for item in chunk] )
+            if on_complete is not None:
+                on_complete( chunk )
+
+        def skip( item ):
+            if on_complete is not None:
+                on_complete( [item] )
+
+        run_parallel( post,
+                      _chunks( self._pending( endpoint, items, skip, complete ), self.batch_size ),
+                      self.jobs,
+                      complete )
+
+    def _pending( self, endpoint, items, skip, complete ):
+        # filters out items which a previous run already created
+        for item in items:
+            if self.journal is not None:
+                if self.journal.is_done( endpoint, item['id'] ):
+                    skip( item )
+                    continue
+                if self.journal.is_unconfirmed( endpoint, item['id'] ) and self.exists( endpoint, item['id'] ):
+                    complete( [item] )
+                    continue
+            yield item
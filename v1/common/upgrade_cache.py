@@ -0,0 +1,81 @@
+import hashlib
+import os
+
+from shared.common.export import open_export_reader
+from shared.common.export import open_export_writer
+from v1.detail.upgrade.v0 import UPGRADE_VERSION
+
+DEFAULT_MAX_SIZE = 1 << 30
+
+# bytes read at once when hashing an input file
+HASH_CHUNK_SIZE = 1 << 20
+
+SUFFIX = '.json'
+
+
+def default_directory():
+    cache_home = os.environ.get( 'XDG_CACHE_HOME' ) or os.path.expanduser( '~/.cache' )
+    return os.path.join( cache_home, 'beaverlog-tools', 'upgrades' )
+
+
+class UpgradeCache:
+    # Upgraded v1 data as compact json files, keyed by the hash of the (v0) input file and UPGRADE_VERSION.
+    # Beyond `max_size` bytes, the least recently used files get removed (a hit refreshes the modification time).
+
+    def __init__( self, directory=None, max_size=DEFAULT_MAX_SIZE ):
+        self.directory = directory if directory is not None else default_directory()
+        self.max_size = max_size
+
+    def key( self, filename ):
+        h = hashlib.blake2b( f'v0-to-v1:{UPGRADE_VERSION}:'.encode(), digest_size=20 )
+        with open( filename, 'rb' ) as f:
+            while True:
+                chunk = f.read( HASH_CHUNK_SIZE )
+                if chunk == b'':
+                    break
+                h.update( chunk )
+        return h.hexdigest()
+
+    def load( self, key ):
+        # returns None if there is no (readable) entry for `key`
+        filename = self._filename( key )
+        try:
+            os.utime( filename )
+            with open_export_reader( filename ) as reader:
+                return reader.load()
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            # e.g. truncated by a full disk
+            os.remove( filename )
+            return None
+
+    def store( self, key, data ):
+        os.makedirs( self.directory, exist_ok=True )
+        with open_export_writer( self._filename( key ), {field: value for field, value in data.items() if field != 'data'},
+                                 indent=None ) as writer:
+            for collection, entities in data['data'].items():
+                writer.write_collection( collection, entities )
+        self.evict()
+
+    def evict( self ):
+        # concurrent runs may evict the same entries
+        entries = []
+        for name in os.listdir( self.directory ):
+            if name.endswith( SUFFIX ):
+                try:
+                    stat = os.stat( os.path.join( self.directory, name ) )
+                except FileNotFoundError:
+                    continue
+                entries.append( (stat.st_mtime_ns, stat.st_size, name) )
+        total = 0
+        for _, size, name in sorted( entries, reverse=True ):
+            total += size
+            if total > self.max_size:
+                try:
+                    os.remove( os.path.join( self.directory, name ) )
+                except FileNotFoundError:
+                    pass
+
+    def _filename( self, key ):
+        return os.path.join( self.directory, key + SUFFIX )
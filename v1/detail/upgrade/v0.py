@@ -1,43 +1,66 @@
 import copy
-import typing
-
-import simplejson as json
 
+from shared.common.codec import loads
+from shared.common.parallel import run_parallel
 from v1.common.ids import EMPTY_ID
 
-next_issue_id = 1
-projects = {}
+# bump whenever the output of upgrade_from_v0 changes, it invalidates the cached upgrades (see v1.common.upgrade_cache)
+UPGRADE_VERSION = 1
+
+# `data` strings per task of a worker process
+DATA_CHUNK_SIZE = 10000
+
+
+class UpgradeContext:
+    # State of one upgrade, so that upgrades can run repeatedly and concurrently.
+
+    def __init__( self, data ):
+        self.data = data
+        self.next_issue_id = 1
+        # project id -> {issue fid: issue id}
+        self.projects = {}
+        # organization subject id -> id of its private child subject
+        self.subject_replacement_map = {}
+        self.subject_map = None
+        self.organization_names = None
 
+    def build_indexes( self ):
+        # once the subjects and organizations got their new ids
+        self.subject_map = {s['id']: s for s in self.data['subjects']}
+        # the first organization wins on duplicate ids
+        self.organization_names = {}
+        for o in self.data['organizations']:
+            self.organization_names.setdefault( o['id'], o['name'] )
 
-def _add_issue_raw( project_id, issue_fid, is_hidden, data ):
-    global next_issue_id
-    global projects
 
-    if not project_id in projects:
-        projects[project_id] = {}
-    projects[project_id][issue_fid] = next_issue_id
+def _add_issue_raw( project_id, issue_fid, is_hidden, context: UpgradeContext ):
+    if not project_id in context.projects:
+        context.projects[project_id] = {}
+    context.projects[project_id][issue_fid] = context.next_issue_id
 
+    data = context.data
     if not 'tracker_issues' in data:
         data['tracker_issues'] = []
     data['tracker_issues'].append( {
-        'id': str( next_issue_id ),
+        'id': str( context.next_issue_id ),
         'project_id': project_id,
         'key': str( issue_fid ),
         'title': str( issue_fid ),
         'is_hidden': is_hidden,
         'was_used': True,
     } )
-    next_issue_id += 1
+    context.next_issue_id += 1
 
 
-def _add_issue( project_id, issue, data ):
-    _add_issue_raw( project_id, issue['issue_fid'], issue['is_archived'], data )
+def _add_issue( project_id, issue, context: UpgradeContext ):
+    _add_issue_raw( project_id, issue['issue_fid'], issue['is_archived'], context )
 
 
-def _get_issue_id( project_id, issue_fid, data ):
+def _get_issue_id( project_id, issue_fid, context: UpgradeContext ):
+    projects = context.projects
     if project_id not in projects or issue_fid not in projects[project_id]:
         # inconsistency in data (should not happen, but does) -> just create the missing issue
-        _add_issue_raw( project_id, issue_fid, False, data )
+        _add_issue_raw( project_id, issue_fid, False, context )
     return projects[project_id][issue_fid]
 
 
@@ -48,7 +71,8 @@ def _convert_link( item ):
     return item
 
 
-def _convert_project( item, subject_id, data ):
+def _convert_project( item, subject_id, context: UpgradeContext ):
+    data = context.data
     item['id'] = str( item['id'] )
     item['link_id'] = str( item['link_id'] )
     item['subject_id'] = subject_id
@@ -60,7 +84,7 @@ def _convert_project( item, subject_id, data ):
     if not 'tracker_issues' in data:
         data['tracker_issues'] = []
     for issue in item['issues']:
-        _add_issue( item['id'], issue, data )
+        _add_issue( item['id'], issue, context )
     del item['issues']
     del item['project_fid']
     return item
@@ -82,7 +106,8 @@ def _transform_organizations( data ):
                 member['user_id'] = str( member['user_id'] )
 
 
-def _transform_subjects( data ):
+def _transform_subjects( context: UpgradeContext ):
+    data = context.data
     for item in data['subjects']:
         item['id'] = str( item['id'] )
         item['organization_id'] = str( item['organization_id'] )
@@ -97,7 +122,7 @@ def _transform_subjects( data ):
                 data['tracker_projects'] = []
             data['tracker_projects'].extend(
                 map(
-                    lambda p: _convert_project( p, item['id'], data ),
+                    lambda p: _convert_project( p, item['id'], context ),
                     [p for p in item['gitlab_projects'] if not (p['is_archived'] == True and len( p['issues'] ) == 0)]
                 )
             )
@@ -109,19 +134,18 @@ def _transform_locations( data ):
         item['id'] = str( item['id'] )
 
 
-def _get_activity_subject_id( sid, data,
-                              subject_map: typing.Dict[str, typing.Dict[str, any]],
-                              subject_replacement_map: typing.Dict[str, str] ):
+def _get_activity_subject_id( sid, context: UpgradeContext ):
     sid = str( sid )
-    s = subject_map[sid]
+    s = context.subject_map[sid]
     is_organization_subject = s['organization_id'] != EMPTY_ID
     if not is_organization_subject:
         return sid
+    subject_replacement_map = context.subject_replacement_map
     if sid in subject_replacement_map:
         return subject_replacement_map[sid]
 
     old_name = s['name']
-    organization_name = next( o['name'] for o in data['organizations'] if o['id'] == s['organization_id'] )
+    organization_name = context.organization_names[s['organization_id']]
 
     # create child subject
     s = copy.deepcopy( s )
@@ -136,7 +160,7 @@ def _get_activity_subject_id( sid, data,
     s.pop( 'created_on', None )
     s.pop( 'gitlab_projects', None )
     s.pop( 'is_project', None )
-    data['subjects'].append( s )
+    context.data['subjects'].append( s )
 
     new_id = s['id']
     new_name = s['name']
@@ -146,45 +170,69 @@ def _get_activity_subject_id( sid, data,
     return s['id']
 
 
-def _transform_activities( data ):
-    subject_map = {s['id']: s for s in data['subjects']}
-    subject_replacement_map = {}
-    for item in data['activities']:
+def _converted_data( string ):
+    try:
+        string_as_json = loads( string )
+        if isinstance( string_as_json, dict ) and 'comment' in string_as_json:
+            return {'comment': string_as_json['comment']}
+        else:
+            return {'original_data': string_as_json}
+    except:
+        if string[:12] == '{"comment":"' and string[-2:] == '"}':
+            return {'comment': string[12:-2]}
+        else:
+            return {'original_data': string}
+
+
+def _convert_data_strings( strings ):
+    return [_converted_data( string ) for string in strings]
+
+
+def _converted_data_strings( activities, processes ):
+    # Parses the string `data` of all activities in worker processes, returns an iterator over the results in
+    # activity order.
+    # Only the strings and their (small) results get passed between the processes: sending whole activities
+    # there and back costs the main process more than transforming them itself.
+    strings = [item['data'] for item in activities if isinstance( item.get( 'data' ), str )]
+    chunks = (strings[i:i + DATA_CHUNK_SIZE] for i in range( 0, len( strings ), DATA_CHUNK_SIZE ))
+    converted = []
+    run_parallel( _convert_data_strings, chunks, processes, converted.extend, ordered=True, processes=True )
+    return iter( converted )
+
+
+def _transform_activities( context: UpgradeContext, processes=1 ):
+    context.build_indexes()
+    converted = _converted_data_strings( context.data['activities'], processes ) if processes > 1 else None
+    for item in context.data['activities']:
         item['id'] = str( item['id'] )
         item['location_id'] = str( item['location_id'] )
         item['subject_ids'] = [
-            _get_activity_subject_id( item['subject_id'], data, subject_map, subject_replacement_map )]
+            _get_activity_subject_id( item['subject_id'], context )]
         del item['subject_id']
         if 'data' in item:
             if isinstance( item['data'], dict ):
                 if 'issue' in item['data']:
                     item['issue_id'] = str( _get_issue_id( str( item['data']['issue']['project_id'] ),
                                                            item['data']['issue']['issue_fid'],
-                                                           data ) )
+                                                           context ) )
                     del item['data']['issue']
             elif isinstance( item['data'], str ):
-                try:
-                    string_as_json = json.loads( item['data'] )
-                    if isinstance( string_as_json, dict ) and 'comment' in string_as_json:
-                        item['data'] = {'comment': string_as_json['comment']}
-                    else:
-                        item['data'] = {'original_data': string_as_json}
-                except:
-                    if item['data'][:12] == '{"comment":"' and item['data'][-2:] == '"}':
-                        item['data'] = {'comment': item['data'][12:-2]}
-                    else:
-                        item['data'] = {'original_data': item['data']}
+                item['data'] = next( converted ) if converted is not None else _converted_data( item['data'] )
             else:
                 item['data'] = {'original_data': item['data']}
 
 
-def upgrade_from_v0( data ):
-    new_data = copy.deepcopy( data )
+def upgrade_from_v0( data, in_place=False, processes=1 ):
+    # `in_place` transforms the entities of `data` themselves instead of a deep copy (which doubles the memory),
+    # `data` must not be used afterwards then.
+    # `processes` > 1 parses the `data` strings of the activities in that many worker processes, with the same result.
+    new_data = data if in_place else copy.deepcopy( data )
     _transform_users( new_data['data'] )
     _transform_organizations( new_data['data'] )
-    _transform_subjects( new_data['data'] )
+    context = UpgradeContext( new_data['data'] )
+    _transform_subjects( context )
     _transform_locations( new_data['data'] )
-    _transform_activities( new_data['data'] )
+    _transform_activities( context, processes )
     return {
         'exported_on': new_data['exported_on'],
         'api_version': 1,
@@ -2,137 +2,70 @@
 
 import argparse
 import datetime
-import json
 import os
 import sys
 
-import progress.bar
-import requests
-
-from shared.common.auth import request_kwargs
+from shared.common.export import DEFAULT_INDENT
+from shared.common.export import open_export_writer
 from shared.common.utils import date_to_string
-from shared.common.utils import simple_changeset_to_list
-from shared.common.utils import verify_response
+from shared.common.utils import print_err
 from v1.common.auth import login
 from v1.common.auth import logout
+from v1.common.data import load_export
+from v1.common.fetch import fetch_server_time
+from v1.common.fetch import stream_data
+from v1.common.fetch import stream_merged_data
 from v1.common.parser import add_default_arguments
 from v1.common.parser import verify_default_arguments
 
 
-def fetch_users( remote_data ):
-    r = requests.get( f'{remote_data.url}/user/', **request_kwargs( remote_data.access_token ) )
-    verify_response( r )
-    return simple_changeset_to_list( r.json() )
-
-
-def fetch_subjects( remote_data ):
-    r = requests.get( f'{remote_data.url}/subject/', **request_kwargs( remote_data.access_token ) )
-    verify_response( r )
-    return simple_changeset_to_list( r.json() )
-
-
-def fetch_locations( remote_data ):
-    r = requests.get( f'{remote_data.url}/location/', **request_kwargs( remote_data.access_token ) )
-    verify_response( r )
-    return simple_changeset_to_list( r.json() )
-
-
-def fetch_activities( remote_data ):
-    r = requests.get( f'{remote_data.url}/activity/', **request_kwargs( remote_data.access_token ) )
-    verify_response( r )
-    return simple_changeset_to_list( r.json() )
-
-
-def fetch_organizations( remote_data ):
-    r = requests.get( f'{remote_data.url}/organization/', **request_kwargs( remote_data.access_token ) )
-    verify_response( r )
-    return simple_changeset_to_list( r.json() )
-
-
-def fetch_tracker_links( remote_data ):
-    r = requests.get( f'{remote_data.url}/tracker-link/', **request_kwargs( remote_data.access_token ) )
-    verify_response( r )
-    return simple_changeset_to_list( r.json() )
-
-
-def fetch_tracker_projects( remote_data ):
-    r = requests.get( f'{remote_data.url}/tracker-project/', **request_kwargs( remote_data.access_token ) )
-    verify_response( r )
-    return simple_changeset_to_list( r.json() )
-
-
-def fetch_tracker_issues( remote_data ):
-    r = requests.get( f'{remote_data.url}/tracker-issue/', **request_kwargs( remote_data.access_token ) )
-    verify_response( r )
-    return simple_changeset_to_list( r.json() )
-
-
-def fetch_reports( remote_data ):
-    r = requests.get( f'{remote_data.url}/report/', **request_kwargs( remote_data.access_token ) )
-    verify_response( r )
-    return simple_changeset_to_list( r.json() )
-
-
-def fetch_data( remote_data ):
-    bar = progress.bar.Bar( f'Downloading...', max=9 )
-    users = fetch_users( remote_data )
-    bar.next()
-    subjects = fetch_subjects( remote_data )
-    bar.next()
-    locations = fetch_locations( remote_data )
-    bar.next()
-    activities = fetch_activities( remote_data )
-    bar.next()
-    organizations = fetch_organizations( remote_data )
-    bar.next()
-    tracker_links = fetch_tracker_links( remote_data )
-    bar.next()
-    tracker_projects = fetch_tracker_projects( remote_data )
-    bar.next()
-    tracker_issues = fetch_tracker_issues( remote_data )
-    bar.next()
-    reports = fetch_reports( remote_data )
-    bar.next()
-    bar.finish()
-    return {
-        'users': users,
-        'subjects': subjects,
-        'locations': locations,
-        'activities': activities,
-        'organizations': organizations,
-        'tracker_links': tracker_links,
-        'tracker_projects': tracker_projects,
-        'tracker_issues': tracker_issues,
-        'reports': reports,
-    }
-
+def export_data( remote_data, filename, skip_warning, jobs=1, previous_data=None, indent=DEFAULT_INDENT ):
+    if os.path.exists( filename ) and not skip_warning:
+        print( f'WARNING: {filename} already exists' )
+        print( f'         and will get overridden' )
+        input( 'Press Enter to continue' )
 
-def export_data( remote_data, filename, skip_warning ):
-    data = {
+    # the server time before fetching is the `since` of the next delta, so that it includes the changes made while
+    # downloading (the local clock may differ from the server's)
+    server_time = fetch_server_time( remote_data )
+    header = {
         'exported_on': date_to_string( datetime.datetime.utcnow() ),
         'api_version': 1,
         'user_id': remote_data.user_id,
-        'data': fetch_data( remote_data ),
+        **({'server_time': server_time} if server_time is not None else {}),
     }
-
-    if os.path.exists( filename ) and not skip_warning:
-        print( f'WARNING: {filename} already exists' )
-        print( f'         and will get overridden' )
-        input( 'Press Enter to continue' )
-    json.dump( data, open( filename, 'w' ), indent=4, sort_keys=False )
+    since = previous_data.get( 'server_time' ) if previous_data is not None else None
+    if previous_data is not None and since is None:
+        print( 'NOTE: The previous export has no server time, downloading everything...' )
+    with open_export_writer( filename, header, indent ) as writer:
+        if since is None:
+            stream_data( remote_data, writer.write_collection, jobs )
+        else:
+            stream_merged_data( remote_data, previous_data, since, writer.write_collection, jobs )
 
 
 def main():
     parser = argparse.ArgumentParser( description='Export Beaverlog data.' )
-    add_default_arguments( parser, with_y=True )
-    parser.add_argument( 'output', metavar='OUTPUT', type=str, help='target json file' )
+    add_default_arguments( parser, with_y=True, with_jobs=True )
+    parser.add_argument( '--previous', metavar='FILE', type=str,
+                         help='previous export to update with the changes since then (may equal OUTPUT)' )
+    parser.add_argument( '--compact', action='store_true', help='write the json without indentation' )
+    parser.add_argument( 'output', metavar='OUTPUT', type=str, help='target file: json, .ndjson (.gz, .bz2, .xz: compressed) or .sqlite' )
 
     args = parser.parse_args()
     verify_default_arguments( args )
 
+    previous_data = None
+    if args.previous is not None:
+        previous_data = load_export( args.previous )
+
     remote_data = login( args.api, args.e, args.u, args.p )
     try:
-        export_data( remote_data, args.output, args.y )
+        if previous_data is not None and previous_data['user_id'] != remote_data.user_id:
+            print_err( f'{args.previous} was exported for another user.' )
+            sys.exit( 1 )
+        export_data( remote_data, args.output, args.y, args.jobs, previous_data,
+                     None if args.compact else DEFAULT_INDENT )
     finally:
         logout( remote_data )
 
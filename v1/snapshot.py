@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+
+from shared.common.export import DEFAULT_INDENT
+from shared.common.export import open_export_reader
+from shared.common.export import open_export_writer
+from shared.common.snapshot_store import SnapshotStore
+from shared.common.utils import print_err
+
+
+def create_snapshot( store: SnapshotStore, filename, name ):
+    with open_export_reader( filename ) as reader:
+        try:
+            name, entities, stored = store.create( reader, name )
+        except ValueError as e:
+            print_err( f'FATAL: {e}' )
+            sys.exit( 1 )
+    print( f'Created snapshot {name} with {entities} entities ({stored} of them new).' )
+
+
+def list_snapshots( store: SnapshotStore ):
+    for name, created_on, header, counts in store.snapshots():
+        collections = ', '.join( f'{count} {key.replace( "_", " " )}' for key, count in counts.items() )
+        print( f'{name}  (created on {created_on}, user {header.get( "user_id" )}): {collections}' )
+
+
+def restore_snapshot( store: SnapshotStore, name, filename, skip_warning, indent ):
+    if not store.exists( name ):
+        print_err( f'FATAL: There is no snapshot {name}.' )
+        sys.exit( 1 )
+    if os.path.exists( filename ) and not skip_warning:
+        print( f'WARNING: {filename} already exists' )
+        print( f'         and will get overridden' )
+        input( 'Press Enter to continue' )
+    with open_export_writer( filename, store.header( name ), indent ) as writer:
+        for key, entities in store.collections( name ):
+            writer.write_collection( key, entities )
+    print( f'Restored snapshot {name} to {filename}.' )
+
+
+def collect_garbage( store: SnapshotStore, keep ):
+    if keep is not None:
+        snapshots = store.snapshots()
+        for name, _, _, _ in snapshots[:max( 0, len( snapshots ) - keep )]:
+            store.delete( name )
+            print( f'Deleted snapshot {name}.' )
+    print( f'Removed {store.collect_garbage()} unreferenced entities.' )
+
+
+def main():
+    parser = argparse.ArgumentParser( description='Keep deduplicated snapshots of Beaverlog exports.' )
+    parser.add_argument( 'store', metavar='STORE', type=str, help='snapshot database, gets created if missing' )
+    commands = parser.add_subparsers( dest='command', required=True )
+    create_parser = commands.add_parser( 'create', help='add an export as new snapshot' )
+    create_parser.add_argument( '--name', metavar='NAME', type=str, help='default: date of the export' )
+    create_parser.add_argument( 'input', metavar='INPUT', type=str, help='source json, ndjson or sqlite file' )
+    commands.add_parser( 'list', help='show all snapshots' )
+    restore_parser = commands.add_parser( 'restore', help='write a snapshot as export' )
+    restore_parser.add_argument( '-y', action='store_true', help='skip warning notice' )
+    restore_parser.add_argument( '--compact', action='store_true', help='write the json without indentation' )
+    restore_parser.add_argument( 'name', metavar='NAME', type=str, help='snapshot to restore' )
+    restore_parser.add_argument( 'output', metavar='OUTPUT', type=str,
+                                 help='target file: json, .ndjson (.gz, .bz2, .xz: compressed) or .sqlite' )
+    gc_parser = commands.add_parser( 'gc', help='remove entities which no snapshot refers to anymore' )
+    gc_parser.add_argument( '--keep', metavar='N', type=int, help='delete all but the newest N snapshots before' )
+
+    args = parser.parse_args()
+
+    if args.command == 'gc' and args.keep is not None and args.keep < 0:
+        print_err( f'--keep must not be negative' )
+        sys.exit( 1 )
+
+    with SnapshotStore( args.store ) as store:
+        if args.command == 'create':
+            create_snapshot( store, args.input, args.name )
+        elif args.command == 'list':
+            list_snapshots( store )
+        elif args.command == 'restore':
+            restore_snapshot( store, args.name, args.output, args.y, None if args.compact else DEFAULT_INDENT )
+        elif args.command == 'gc':
+            collect_garbage( store, args.keep )
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit( main() )
+    except KeyboardInterrupt:
+        sys.exit( 1 )
@@ -1,22 +1,123 @@
 #!/usr/bin/env python3
 
 import argparse
+import os
 import sys
+import time
 
+import progress.bar
+
+from shared.common.codec import dumps_pretty
+from shared.common.parallel import run_parallel
+from shared.common.utils import print_err
+from v1.common.batch_upgrade import expand_inputs
+from v1.common.batch_upgrade import is_up_to_date
+from v1.common.batch_upgrade import upgrade_file
 from v1.common.data import load_data
 from v1.common.data import save_data
+from v1.common.parser import add_upgrade_cache_arguments
+from v1.common.parser import upgrade_cache_of
+
+REPORT_FILENAME = 'upgrade-report.json'
+
+
+def upgrade_batch( patterns, output_dir, processes, force, report_filename ):
+    # returns the number of failed files
+    try:
+        tasks = expand_inputs( patterns, output_dir )
+    except ValueError as e:
+        print_err( f'FATAL: {e}' )
+        sys.exit( 1 )
+
+    results = {}
+    pending = []
+    for input_filename, output_filename in tasks:
+        if not force and is_up_to_date( input_filename, output_filename ):
+            results[input_filename] = (output_filename, 'up to date', 0.0, None, [])
+        else:
+            pending.append( (input_filename, output_filename) )
+    # the largest files first, so that none of them is left for the end
+    pending.sort( key=lambda task: os.path.getsize( task[0] ), reverse=True )
+
+    def on_upgraded( result ):
+        input_filename, output_filename, seconds, error, messages = result
+        results[input_filename] = (output_filename, 'failed' if error is not None else 'upgraded', seconds, error,
+                                   messages)
+        bar.next()
+
+    start = time.perf_counter()
+    bar = progress.bar.Bar( f'Upgrading {len( pending )} of {len( tasks )} files...', max=max( 1, len( pending ) ) )
+    # every file gets upgraded in a single process, the files in parallel
+    run_parallel( upgrade_file, pending, processes, on_upgraded, processes=True )
+    bar.finish()
+    elapsed = time.perf_counter() - start
+
+    counts = {status: 0 for status in ('upgraded', 'up to date', 'failed')}
+    report = []
+    for input_filename, _ in tasks:
+        output_filename, status, seconds, error, messages = results[input_filename]
+        counts[status] += 1
+        report.append( {
+            'input': input_filename,
+            'output': output_filename,
+            'status': status,
+            'seconds': round( seconds, 3 ),
+            **({'error': error} if error is not None else {}),
+            **({'messages': messages} if len( messages ) > 0 else {}),
+        } )
+        if error is not None:
+            print_err( f'{input_filename}: {error}' )
+
+    os.makedirs( output_dir, exist_ok=True )
+    with open( report_filename, 'w' ) as f:
+        f.write( dumps_pretty( {
+            'seconds': round( elapsed, 3 ),
+            **{status.replace( ' ', '_' ): count for status, count in counts.items()},
+            'files': report,
+        } ) + '\n' )
+
+    print( f'Upgraded {counts["upgraded"]}, skipped {counts["up to date"]} up to date and failed on {counts["failed"]} '
+           f'files in {elapsed:.1f} s, see {report_filename}.' )
+    return counts['failed']
 
 
 def main():
-    parser = argparse.ArgumentParser( description='Upgrade a Beaverlog data file.' )
+    parser = argparse.ArgumentParser( description='Upgrade a Beaverlog data file.',
+                                      usage='%(prog)s [options] INPUT OUTPUT\n'
+                                            '       %(prog)s [options] --batch OUTPUT_DIR INPUT [INPUT ...]' )
     parser.add_argument( '-y', action='store_true', help='skip warning notice' )
-    parser.add_argument( 'input', metavar='INPUT', type=str, help='source json file' )
-    parser.add_argument( 'output', metavar='OUTPUT', type=str, help='target json file' )
+    parser.add_argument( '--processes', metavar='N', type=int,
+                         help='worker processes for the activities (--batch: for the files), default: number of CPUs' )
+    add_upgrade_cache_arguments( parser )
+    parser.add_argument( '--batch', metavar='OUTPUT_DIR', type=str,
+                         help='upgrade every INPUT (files, directories with exports or glob patterns) into OUTPUT_DIR' )
+    parser.add_argument( '--force', action='store_true',
+                         help='with --batch: also upgrade files whose output is newer than the input' )
+    parser.add_argument( '--report', metavar='FILE', type=str,
+                         help=f'with --batch: timing and failures per file, default: OUTPUT_DIR/{REPORT_FILENAME}' )
+    parser.add_argument( 'paths', metavar='PATH', type=str, nargs='+',
+                         help='INPUT OUTPUT: source json, ndjson (may be compressed) or sqlite file and target file '
+                              '(json, .ndjson, .gz, .bz2, .xz: compressed or .sqlite), '
+                              'with --batch: INPUT [INPUT ...]' )
 
     args = parser.parse_args()
+    processes = args.processes if args.processes is not None else os.cpu_count() or 1
+    if processes < 1:
+        print_err( '--processes must be at least 1.' )
+        sys.exit( 1 )
+
+    if args.batch is not None:
+        report_filename = args.report if args.report is not None else os.path.join( args.batch, REPORT_FILENAME )
+        if upgrade_batch( args.paths, args.batch, processes, args.force, report_filename ) > 0:
+            sys.exit( 1 )
+        return
+
+    if len( args.paths ) != 2:
+        parser.error( 'expected INPUT and OUTPUT (or --batch)' )
+    input_filename, output_filename = args.paths
 
-    data = load_data( args.input, True )
-    save_data( data, args.output, args.y )
+    data = load_data( input_filename, True, processes=processes, cache=upgrade_cache_of( args ) )
+    save_data( data, output_filename, args.y )
 
     print( 'Conversion successful.' )
 
@@ -1,31 +1,37 @@
 #!/usr/bin/env python3
 
 import argparse
+import collections
 import copy
 import json
+import os
 import sys
 
 import progress.bar
-import requests
 import typing
 
-from shared.common.auth import request_kwargs
+from shared.common.client import client
+from shared.common.graph import dependency_levels
 from shared.common.utils import pretty_json
 from shared.common.utils import print_err
-from shared.common.utils import simple_changeset_to_list
-from shared.common.utils import verify_response
 from v1.common.auth import login
 from v1.common.auth import logout
 from v1.common.clear import clear_data
-from v1.common.data import load_data
+from v1.common.data import load_data_and_version
+from v1.common.fetch import fetch_data
 from v1.common.ids import EMPTY_ID
+from v1.common.journal import UploadJournal
 from v1.common.parser import add_default_arguments
+from v1.common.parser import add_upgrade_cache_arguments
+from v1.common.parser import upgrade_cache_of
 from v1.common.parser import verify_default_arguments
 from v1.common.remote import IdManager
 from v1.common.remote import RemoteData
+from v1.common.transport import DEFAULT_BATCH_SIZE
+from v1.common.transport import Transport
 
 
-def import_subject( remote_data: RemoteData, subject ):
+def subject_data( remote_data: RemoteData, subject ):
     data = {
         'id_token': remote_data.id_manager.id_token,
         **subject,
@@ -36,14 +42,11 @@ def import_subject( remote_data: RemoteData, subject ):
     data.pop( 'activity_count', None )
     data.pop( 'milliseconds', None )
     data.pop( 'ancestor_ids', None )
-    r = requests.post( f'{remote_data.url}/subject/', json=data, **request_kwargs( remote_data.access_token ) )
-    verify_response( r, data )
-    changes = simple_changeset_to_list( r.json() )
-    assert len( changes ) == 1
+    return data
 
 
 def check_subject_id_exists_on_server( remote_data: RemoteData, subject_id ):
-    r = requests.get( f'{remote_data.url}/subject/{subject_id}', **request_kwargs( remote_data.access_token ) )
+    r = client.get( f'{remote_data.url}/subject/{subject_id}', token=remote_data.access_token )
     if not (200 <= r.status_code < 300):
         return False
     return True
@@ -84,9 +87,10 @@ def verify_subject_ids_exist_on_server( remote_data: RemoteData, subject_ids: ty
         sys.exit( 1 )
 
 
-def import_subjects( remote_data: RemoteData,
-                     subjects, organizations, parent_id_map,
-                     subject_name_whitelist, subject_name_blacklist ):
+def prepare_subjects( remote_data: RemoteData,
+                      subjects, organizations, parent_id_map,
+                      subject_name_whitelist, subject_name_blacklist ):
+    # maps the ids of all private subjects to import and sorts them topologically
     organization_subject_ids = set( s['id'] for s in subjects if s['organization_id'] != EMPTY_ID )
     remote_organization_subject_ids = copy.copy( organization_subject_ids )
 
@@ -125,28 +129,39 @@ def import_subjects( remote_data: RemoteData,
         new_subjects.append( entity )
 
     verify_subject_ids_exist_on_server( remote_data, referenced_organization_subject_ids, subjects, organizations )
-    processed_ids = set()
     pending = {item['id']: item for item in new_subjects}
-    bar = progress.bar.Bar( f'Uploading...', max=len( new_subjects ) )
-    while len( pending ) > 0:
-        done = []
-        for key, entity in pending.items():
-            private_parent_ids = list(
-                filter( lambda id_: id_ not in remote_organization_subject_ids, entity['parent_ids'] ) )
-            if len( private_parent_ids ) == 0 or all( parent_id in processed_ids for parent_id in private_parent_ids ):
-                processed_ids.add( entity['id'] )
-                import_subject( remote_data, entity )
-                bar.next()
-                done.append( key )
-        for key in done:
-            del pending[key]
-        if len( done ) == 0:
-            print_err( f'\nFATAL: The following subjects have dangling parents:\n{pretty_json( pending )}' )
-            sys.exit( 1 )
+    private_parent_ids = {
+        key: [id_ for id_ in entity['parent_ids'] if id_ not in remote_organization_subject_ids]
+        for key, entity in pending.items()
+    }
+    dangling = [pending[key] for key, parent_ids in private_parent_ids.items()
+                if any( parent_id not in pending for parent_id in parent_ids )]
+    if len( dangling ) > 0:
+        print_err( f'FATAL: The following subjects have dangling parents:\n{pretty_json( dangling )}' )
+        sys.exit( 1 )
+    levels, cyclic = dependency_levels( private_parent_ids )
+    if len( cyclic ) > 0:
+        cyclic_subjects = [pending[key] for key in cyclic]
+        print_err( f'FATAL: The following subjects have cyclic parents:\n{pretty_json( cyclic_subjects )}' )
+        sys.exit( 1 )
+    return pending, levels
+
+
+def import_subjects( remote_data: RemoteData,
+                     subjects, organizations, parent_id_map,
+                     subject_name_whitelist, subject_name_blacklist, transport: Transport ):
+    pending, levels = prepare_subjects( remote_data, subjects, organizations, parent_id_map,
+                                        subject_name_whitelist, subject_name_blacklist )
+
+    # all subjects of a level only depend on subjects of previous levels
+    bar = progress.bar.Bar( f'Uploading...', max=len( pending ) )
+    for level in levels:
+        transport.post_all( 'subject', (subject_data( remote_data, pending[key] ) for key in level),
+                            lambda chunk: bar.next( len( chunk ) ) )
     bar.finish()
 
 
-def import_location( remote_data: RemoteData, location ):
+def location_data( remote_data: RemoteData, location ):
     data = {
         'id_token': remote_data.id_manager.id_token,
         **location,
@@ -157,44 +172,20 @@ def import_location( remote_data: RemoteData, location ):
     data.pop( 'activity_end', None )
     data.pop( 'activity_count', None )
     data.pop( 'milliseconds', None )
-    r = requests.post( f'{remote_data.url}/location/', json=data,
-                       **request_kwargs( remote_data.access_token ) )
-    verify_response( r, data )
-    changes = simple_changeset_to_list( r.json() )
-    assert len( changes ) == 1
-
-
-def import_locations( remote_data: RemoteData, locations ):
-    bar = progress.bar.Bar( f'Uploading...', max=len( locations ) )
-    for location in locations:
-        import_location( remote_data, location )
-        bar.next()
-    bar.finish()
+    return data
 
 
-def import_tracker_link( remote_data: RemoteData, tracker_link ):
+def tracker_link_data( remote_data: RemoteData, tracker_link ):
     data = {
         'id_token': remote_data.id_manager.id_token,
         **tracker_link,
         'id': remote_data.id_manager.mapped_id( 'tracker_link', tracker_link['id'] ),
     }
     data.pop( 'created_on', None )
-    r = requests.post( f'{remote_data.url}/tracker-link/', json=data,
-                       **request_kwargs( remote_data.access_token ) )
-    verify_response( r, data )
-    changes = simple_changeset_to_list( r.json() )
-    assert len( changes ) == 1
-
-
-def import_tracker_links( remote_data: RemoteData, tracker_links ):
-    bar = progress.bar.Bar( f'Uploading...', max=len( tracker_links ) )
-    for tracker_link in tracker_links:
-        import_tracker_link( remote_data, tracker_link )
-        bar.next()
-    bar.finish()
+    return data
 
 
-def import_tracker_project( remote_data: RemoteData, tracker_project ):
+def tracker_project_data( remote_data: RemoteData, tracker_project ):
     data = {
         'id_token': remote_data.id_manager.id_token,
         **tracker_project,
@@ -205,22 +196,10 @@ def import_tracker_project( remote_data: RemoteData, tracker_project ):
             if 'subject_id' in tracker_project and tracker_project['subject_id'] != EMPTY_ID else EMPTY_ID,
     }
     data.pop( 'created_on', None )
-    r = requests.post( f'{remote_data.url}/tracker-project/', json=data,
-                       **request_kwargs( remote_data.access_token ) )
-    verify_response( r, data )
-    changes = simple_changeset_to_list( r.json() )
-    assert len( changes ) == 1
-
-
-def import_tracker_projects( remote_data: RemoteData, tracker_projects ):
-    bar = progress.bar.Bar( f'Uploading...', max=len( tracker_projects ) )
-    for tracker_project in tracker_projects:
-        import_tracker_project( remote_data, tracker_project )
-        bar.next()
-    bar.finish()
+    return data
 
 
-def import_tracker_issue( remote_data: RemoteData, tracker_issue ):
+def tracker_issue_data( remote_data: RemoteData, tracker_issue ):
     data = {
         'id_token': remote_data.id_manager.id_token,
         **tracker_issue,
@@ -228,22 +207,10 @@ def import_tracker_issue( remote_data: RemoteData, tracker_issue ):
         'project_id': remote_data.id_manager.mapped_id( 'tracker_project', tracker_issue['project_id'], True ),
     }
     data.pop( 'created_on', None )
-    r = requests.post( f'{remote_data.url}/tracker-issue/', json=data,
-                       **request_kwargs( remote_data.access_token ) )
-    verify_response( r, data )
-    changes = simple_changeset_to_list( r.json() )
-    assert len( changes ) == 1
-
-
-def import_tracker_issues( remote_data: RemoteData, tracker_issues ):
-    bar = progress.bar.Bar( f'Uploading...', max=len( tracker_issues ) )
-    for tracker_issue in tracker_issues:
-        import_tracker_issue( remote_data, tracker_issue )
-        bar.next()
-    bar.finish()
+    return data
 
 
-def import_activity( remote_data: RemoteData, activity ):
+def activity_data( remote_data: RemoteData, activity ):
     data = {
         'id_token': remote_data.id_manager.id_token,
         **activity,
@@ -256,20 +223,40 @@ def import_activity( remote_data: RemoteData, activity ):
             if 'issue_id' in activity and activity['issue_id'] != EMPTY_ID else EMPTY_ID,
     }
     data.pop( 'created_on', None )
-    r = requests.post( f'{remote_data.url}/activity/', json=data,
-                       **request_kwargs( remote_data.access_token ) )
-    verify_response( r, data )
+    return data
 
 
-def import_activities( remote_data: RemoteData, activities ):
-    bar = progress.bar.Bar( f'Uploading...', max=len( activities ) )
-    for activity in activities:
-        import_activity( remote_data, activity )
-        bar.next()
+def import_entities( remote_data: RemoteData, endpoint, to_data, entities, transport: Transport,
+                     single_change=True ):
+    # ids are mapped in the calling thread (in input order), only the requests run in parallel
+    bar = progress.bar.Bar( f'Uploading...', max=len( entities ) )
+    transport.post_all( endpoint, (to_data( remote_data, entity ) for entity in entities),
+                        lambda chunk: bar.next( len( chunk ) ), single_change )
     bar.finish()
 
 
-def import_json( remote_data: RemoteData, data, parent_id_map, subject_name_whitelist, subject_name_blacklist ):
+def import_locations( remote_data: RemoteData, locations, transport: Transport ):
+    import_entities( remote_data, 'location', location_data, locations, transport )
+
+
+def import_tracker_links( remote_data: RemoteData, tracker_links, transport: Transport ):
+    import_entities( remote_data, 'tracker-link', tracker_link_data, tracker_links, transport )
+
+
+def import_tracker_projects( remote_data: RemoteData, tracker_projects, transport: Transport ):
+    import_entities( remote_data, 'tracker-project', tracker_project_data, tracker_projects, transport )
+
+
+def import_tracker_issues( remote_data: RemoteData, tracker_issues, transport: Transport ):
+    import_entities( remote_data, 'tracker-issue', tracker_issue_data, tracker_issues, transport )
+
+
+def import_activities( remote_data: RemoteData, activities, transport: Transport ):
+    import_entities( remote_data, 'activity', activity_data, activities, transport, single_change=False )
+
+
+def import_json( remote_data: RemoteData, data, parent_id_map, subject_name_whitelist, subject_name_blacklist,
+                 transport: Transport ):
     if 'subjects' in data:
         print( 'Importing subject data...' )
         import_subjects( remote_data,
@@ -277,23 +264,24 @@ def import_json( remote_data: RemoteData, data, parent_id_map, subject_name_whit
                          data['organizations'] if 'organizations' in data else [],
                          parent_id_map,
                          subject_name_whitelist,
-                         subject_name_blacklist )
+                         subject_name_blacklist,
+                         transport )
 
     if 'locations' in data:
         print( 'Importing location data...' )
-        import_locations( remote_data, data['locations'] )
+        import_locations( remote_data, data['locations'], transport )
 
     if 'tracker_links' in data:
         print( 'Importing tracker link data...' )
-        import_tracker_links( remote_data, data['tracker_links'] )
+        import_tracker_links( remote_data, data['tracker_links'], transport )
 
     if 'tracker_projects' in data:
         print( 'Importing tracker project data...' )
-        import_tracker_projects( remote_data, data['tracker_projects'] )
+        import_tracker_projects( remote_data, data['tracker_projects'], transport )
 
     if 'tracker_issues' in data:
         print( 'Importing tracker issue data...' )
-        import_tracker_issues( remote_data, data['tracker_issues'] )
+        import_tracker_issues( remote_data, data['tracker_issues'], transport )
 
     if 'activities' in data:
         print( 'Importing activity data...' )
@@ -302,7 +290,119 @@ def import_json( remote_data: RemoteData, data, parent_id_map, subject_name_whit
                 if not remote_data.id_manager.has_id( 'subject', sid ):
                     print(f'sid missing: {sid}')
                     assert False
-        import_activities( remote_data, data['activities'] )
+        import_activities( remote_data, data['activities'], transport )
+
+
+SYNC_COLLECTIONS = [
+    # collection, IdManager entity, endpoint, payload function
+    ('subjects', 'subject', 'subject', subject_data),
+    ('locations', 'location', 'location', location_data),
+    ('tracker_links', 'tracker_link', 'tracker-link', tracker_link_data),
+    ('tracker_projects', 'tracker_project', 'tracker-project', tracker_project_data),
+    ('tracker_issues', 'tracker_issue', 'tracker-issue', tracker_issue_data),
+    ('activities', 'activity', 'activity', activity_data),
+]
+
+
+def _normalized( key, value ):
+    # the payloads fill in defaults (e.g. EMPTY_ID) for fields which the server may leave out
+    if value in (None, '', [], {}) or (key.endswith( '_id' ) and value == EMPTY_ID):
+        return None
+    return value
+
+
+def is_changed( data, current ):
+    return any( _normalized( key, current.get( key ) ) != _normalized( key, value )
+                for key, value in data.items() if key != 'id_token' )
+
+
+def sync_entities( endpoint, datas, current, transport: Transport, stats: collections.Counter ):
+    creates = [data for data in datas if data['id'] not in current]
+    updates = [{key: value for key, value in data.items() if key != 'id_token'}
+               for data in datas if data['id'] in current and is_changed( data, current[data['id']] )]
+    stats['created'] += len( creates )
+    stats['updated'] += len( updates )
+    stats['unchanged'] += len( datas ) - len( creates ) - len( updates )
+    bar = progress.bar.Bar( f'Syncing...', max=len( creates ) + len( updates ) )
+    transport.post_all( endpoint, creates, lambda chunk: bar.next( len( chunk ) ) )
+    transport.put_all( endpoint, updates, lambda _: bar.next() )
+    bar.finish()
+
+
+def delete_obsolete_subjects( obsolete_subjects, transport: Transport ):
+    # children first
+    obsolete_ids = set( s['id'] for s in obsolete_subjects )
+    levels, cyclic = dependency_levels(
+        {s['id']: [parent_id for parent_id in s['parent_ids'] if parent_id in obsolete_ids] for s in obsolete_subjects} )
+    for level in reversed( levels + [cyclic] ):
+        transport.delete_all( 'subject', level )
+
+
+def confirm_deletions( remote_data: RemoteData, obsolete, skip_warning ):
+    counts = [(collection, len( items )) for collection, items in obsolete.items() if len( items ) > 0]
+    if len( counts ) == 0:
+        return
+    print( f'WARNING: This will permanently delete the following data missing in the input' )
+    print( f'         on {remote_data.url}:' )
+    for collection, count in counts:
+        print( f'         {count} {collection.replace( "_", " " )}' )
+    if not skip_warning:
+        input( 'Press Enter to continue' )
+
+
+def sync_json( remote_data: RemoteData, data, server_data, parent_id_map, subject_name_whitelist,
+               subject_name_blacklist, transport: Transport, skip_warning ):
+    # Only creates, updates and deletes what differs between `data` and `server_data`.
+    # Entities present on the server keep their ids, all others get new ones.
+    current = {}
+    for collection, entity, _, _ in SYNC_COLLECTIONS:
+        current[collection] = {}
+        for item in server_data.get( collection, [] ):
+            remote_data.id_manager.map_id( entity, item['id'], item['id'] )
+            current[collection][item['id']] = item
+    current['subjects'] = {key: s for key, s in current['subjects'].items() if s['organization_id'] == EMPTY_ID}
+
+    # the payloads of every collection (subjects: per level), all ids get mapped before anything changes
+    datas = {}
+    if 'subjects' in data:
+        pending, levels = prepare_subjects( remote_data,
+                                            data['subjects'],
+                                            data['organizations'] if 'organizations' in data else [],
+                                            parent_id_map,
+                                            subject_name_whitelist,
+                                            subject_name_blacklist )
+        datas['subjects'] = [[subject_data( remote_data, pending[key] ) for key in level] for level in levels]
+    for collection, _, _, to_data in SYNC_COLLECTIONS[1:]:
+        if collection in data:
+            datas[collection] = [[to_data( remote_data, item ) for item in data[collection]]]
+
+    obsolete = {}
+    for collection, _, _, _ in reversed( SYNC_COLLECTIONS ):
+        if collection in datas:
+            desired_ids = set( item['id'] for level in datas[collection] for item in level )
+            obsolete[collection] = [item for key, item in current[collection].items() if key not in desired_ids]
+    confirm_deletions( remote_data, obsolete, skip_warning )
+
+    stats = collections.Counter()
+    for collection, _, endpoint, _ in SYNC_COLLECTIONS:
+        if collection in datas:
+            print( 'Syncing subject data...' if collection == 'subjects' else
+                   f'Syncing {collection.replace( "_", " " )} data...' )
+            for level in datas[collection]:
+                sync_entities( endpoint, level, current[collection], transport, stats )
+
+    print( 'Removing obsolete data...' )
+    for collection, _, endpoint, _ in reversed( SYNC_COLLECTIONS ):
+        if collection not in obsolete:
+            continue
+        stats['deleted'] += len( obsolete[collection] )
+        if collection == 'subjects':
+            delete_obsolete_subjects( obsolete[collection], transport )
+        else:
+            transport.delete_all( endpoint, [item['id'] for item in obsolete[collection]] )
+
+    print( f'Created {stats["created"]}, updated {stats["updated"]}, deleted {stats["deleted"]} '
+           f'and kept {stats["unchanged"]} entities.' )
 
 
 def map_parent_ids( subjects, parent_id_map ):
@@ -317,14 +417,24 @@ def map_parent_ids( subjects, parent_id_map ):
 
 def main():
     parser = argparse.ArgumentParser( description='(Re)import Beaverlog data.' )
-    add_default_arguments( parser, with_y=True )
+    add_default_arguments( parser, with_y=True, with_jobs=True )
     parser.add_argument( '--parent-id-map', metavar='JSON', type=str, help='map for organization parent ids' )
     parser.add_argument( '--whitelist', metavar='JSON', type=str, help='array with subject names to allow' )
     parser.add_argument( '--blacklist', metavar='JSON', type=str, help='array with subject names to ignore' )
-    parser.add_argument( 'input', metavar='INPUT', type=str, help='source json file' )
+    parser.add_argument( '--batch-size', metavar='N', type=int, default=DEFAULT_BATCH_SIZE,
+                         help='entities per request, greater than 1 needs a server with batch endpoints '
+                              '(/batch/<endpoint>/), default: %(default)s' )
+    parser.add_argument( '--sync', action='store_true',
+                         help='only upload the differences to the current server data instead of clearing it' )
+    parser.add_argument( '--journal', metavar='JOURNAL', type=str, help='record the progress to resume it later' )
+    parser.add_argument( '--resume', metavar='JOURNAL', type=str, help='continue an interrupted upload (no clear)' )
+    add_upgrade_cache_arguments( parser )
+    parser.add_argument( 'input', metavar='INPUT', type=str,
+                         help='v0 or v1 export: json, ndjson (may be compressed) or sqlite file' )
 
     args = parser.parse_args()
     verify_default_arguments( args )
+    upgrade_cache = upgrade_cache_of( args )
 
     parent_id_map = {}
     if args.parent_id_map is not None:
@@ -338,18 +448,63 @@ def main():
     if args.blacklist is not None:
         subject_name_blacklist = set( json.loads( args.blacklist ) )
 
+    if args.batch_size < 1:
+        print_err( f'--batch-size must be at least 1' )
+        sys.exit( 1 )
+
     if subject_name_whitelist & subject_name_blacklist:
         print_err( f'--whitelist and --blacklist must not have common items' )
         sys.exit( 1 )
 
+    if args.journal is not None and args.resume is not None:
+        print_err( f'--journal and --resume are mutually exclusive' )
+        sys.exit( 1 )
+
+    if args.sync and args.resume is not None:
+        print_err( f'--sync and --resume are mutually exclusive' )
+        sys.exit( 1 )
+
+    if args.journal is not None and os.path.exists( args.journal ) and not args.y:
+        print_err( f'FATAL: {args.journal} already exists, continue it with --resume or overwrite it with -y' )
+        sys.exit( 1 )
+
+    journal = None
+    if args.resume is not None:
+        journal, id_manager = UploadJournal.load( args.resume )
+        if os.path.abspath( journal.input_filename ) != os.path.abspath( args.input ):
+            print_err( f'WARNING: {args.resume} was recorded for {journal.input_filename}' )
+
+    # v1 exports (json, ndjson or sqlite) as well as upgraded v0 data, loaded before anything gets cleared
+    data, version = load_data_and_version( args.input, allow_v1=True, cache=upgrade_cache )
+    if args.sync and version == 0 and not args.y:
+        # the upgrade assigns new ids, which never match the ones on the server
+        print_err( f'FATAL: --sync on v0 data replaces all data on {args.api}, '
+                   f'confirm this with -y or upload without --sync' )
+        sys.exit( 1 )
+
     remote_data = login( args.api, args.e, args.u, args.p )
     try:
-        remote_data.id_manager = IdManager( remote_data.url, remote_data.access_token )
-        clear_data( remote_data, args.y )
-        data = load_data( args.input )
-        import_json( remote_data, data['data'], parent_id_map, subject_name_whitelist,
-                     subject_name_blacklist )
+        if journal is not None:
+            print( f'Resuming upload from {args.resume}...' )
+            remote_data.id_manager = id_manager
+        else:
+            remote_data.id_manager = IdManager( remote_data.url, remote_data.access_token )
+            if not args.sync:
+                clear_data( remote_data, args.y )
+            if args.journal is not None:
+                journal = UploadJournal.create( args.journal, args.input, remote_data.id_manager )
+        transport = Transport( remote_data, args.jobs, args.batch_size, journal )
+        if args.sync:
+            print( 'Fetching current data...' )
+            server_data = fetch_data( remote_data, args.jobs )
+            sync_json( remote_data, data['data'], server_data, parent_id_map, subject_name_whitelist,
+                       subject_name_blacklist, transport, args.y )
+        else:
+            import_json( remote_data, data['data'], parent_id_map, subject_name_whitelist,
+                         subject_name_blacklist, transport )
     finally:
+        if journal is not None:
+            journal.close()
         logout( remote_data )
 
     print( 'Import successful.' )